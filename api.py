@@ -1,25 +1,417 @@
+"""апи библиотека к веб приложению Pet Friends.
+
+requests, urllib3 и модули, которые от них зависят (metrics), импортируются
+только при первом запросе, поэтому import api и создание PetFriends не тратят на них время.
+Логи пишутся в логгер 'api' и по умолчанию никуда не выводятся, включить вывод: configure_logging()"""
+from __future__ import annotations
+
+import codecs
+import hashlib
 import json
-import requests
-from requests_toolbelt.multipart.encoder import MultipartEncoder
 import logging
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from models import Pet, PetIndex, PetList
+from photos import MultipartStream, PetPhoto
+
+if TYPE_CHECKING:
+    import requests
+
+    from cassette import Cassette
+    from photos import PhotoPreprocessor
+    from throttle import Throttle
+    from workflow import Workflow
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level: int = logging.INFO):
+    """Включает вывод логов api в консоль (раньше это делалось при импорте модуля)"""
+
+    logging.basicConfig(level=level)
+
+# Начало массива питомцев в ответе api/pets: {"pets": [...]}
+PETS_ARRAY_START = re.compile(r'"pets"\s*:\s*\[')
+
+
+class BatchResult:
+    """Результат пакетной операции PetFriends. При итерации отдаёт кортежи (item, status, result)
+    по мере завершения запросов и подсчитывает количество успешных и неуспешных операций"""
+
+    def __init__(self, futures: dict):
+        self._futures = futures
+        self._pending = as_completed(futures)
+        self.succeeded = 0
+        self.failed = 0
+
+    def __len__(self):
+        return len(self._futures)
+
+    def __iter__(self):
+        for future in self._pending:
+            item = self._futures[future]
+            try:
+                status, result = future.result()
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении запроса для {item}: {e}")
+                status, result = None, str(e)
+            if status == 200:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            yield item, status, result
+
+    def wait(self) -> 'BatchResult':
+        """Дожидается завершения всех оставшихся запросов"""
+
+        for _ in self:
+            pass
+        return self
+
+
+class ResponseCache:
+    """LRU кэш ответов со списками питомцев. Вытесняет самые давно использованные записи,
+    когда их больше max_entries или суммарный размер ответов больше max_bytes"""
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 64 * 1024 * 1024, ttl: float = 5):
+        """ttl - сколько секунд считать свежим ответ, у которого нет ETag и Last-Modified
+        (такие ответы нельзя перепроверить на сервере)"""
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple) -> dict:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: dict):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old['size']
+            if entry['size'] > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += entry['size']
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted['size']
+
+    def invalidate(self, auth_key: str):
+        """Удаляет все списки, полученные с ключом auth_key"""
+
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == auth_key]:
+                self.size -= self._entries.pop(key)['size']
 
-logging.basicConfig(level=logging.INFO)
 
 class PetFriends:
     """апи библиотека к веб приложению Pet Friends"""
 
-    def __init__(self):
-        self.base_url = "https://petfriends.skillfactory.ru/"
+    # Методы, которые можно безопасно повторять при сетевых сбоях
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+    def __init__(self, base_url: str = "https://petfriends.skillfactory.ru/",
+                 pool_connections: int = 10, pool_maxsize: int = 10, timeout: tuple = (5, 30),
+                 max_retries: int = 3, backoff_factor: float = 0.3, keep_alive: bool = True,
+                 max_workers: int = None, key_ttl: float = 600, key_cache_file: str = None,
+                 response_cache: ResponseCache = None, metrics_hooks: list = None, use_models: bool = False,
+                 throttle: Throttle = None, cassette: Cassette = None,
+                 photo_preprocessor: PhotoPreprocessor = None):
+        """Все методы класса работают через одну сессию requests с пулом соединений,
+        поэтому TCP/TLS рукопожатие с сервером выполняется один раз на соединение, а не на
+        каждый запрос.
+
+        base_url - адрес сервера Pet Friends, например локального fake_server;
+        pool_connections - количество хостов, для которых держится пул соединений;
+        pool_maxsize - максимальное количество соединений к одному хосту;
+        timeout - таймаут (на подключение, на чтение ответа) в секундах;
+        max_retries - количество повторов идемпотентных запросов (GET, PUT, DELETE);
+        backoff_factor - множитель экспоненциальной задержки между повторами;
+        keep_alive - держать ли соединения открытыми между запросами;
+        max_workers - количество потоков для пакетных операций (по умолчанию pool_maxsize);
+        key_ttl - сколько секунд хранить полученный get_api_key ключ (0 - не кэшировать);
+        key_cache_file - путь к файлу, в котором ключи сохраняются между запусками;
+        response_cache - ResponseCache для ответов get_list_of_pets (по умолчанию не используется);
+        metrics_hooks - функции, получающие metrics.RequestTiming после каждого запроса. Без хуков
+        запросы не замеряются и работают через обычный HTTPAdapter;
+        use_models - возвращать питомцев как models.Pet и списки как models.PetList вместо
+        словарей (меньше памяти на больших списках, поля доступны и как pet.name, и как pet['name']);
+        throttle - throttle.Throttle с ограничением частоты запросов и предохранителями по эндпоинтам.
+        Пока предохранитель эндпоинта разомкнут, запросы к нему сразу бросают CircuitOpenError;
+        cassette - cassette.Cassette, в которую записываются запросы и ответы или из которой
+        они воспроизводятся без обращения к серверу;
+        photo_preprocessor - photos.PhotoPreprocessor, который уменьшает и пережимает фото перед
+        загрузкой в add_new_pet и post_new_photo_of_pet и кэширует результат по содержимому фото"""
+
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.keep_alive = keep_alive
+        self.metrics_hooks = list(metrics_hooks or [])
+        # Сессия создаётся при первом запросе, см. session
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        self.max_workers = max_workers or pool_maxsize
+        # Пул потоков для пакетных операций создаётся при первой из них, см. executor
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        self.key_ttl = key_ttl
+        self.key_cache_file = key_cache_file
+        self._api_keys = self._load_api_keys()
+        self._key_owners = {}
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+
+        self.response_cache = response_cache
+        self.use_models = use_models
+        # Индексы, которые обновляются после изменений питомцев, по ключу auth_key
+        self._pet_indexes = {}
+        self._pet_indexes_lock = threading.Lock()
+        self.throttle = throttle
+        self.cassette = cassette
+        self.photo_preprocessor = photo_preprocessor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Закрывает все соединения из пула"""
+
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if self._session is not None:
+            self._session.close()
+
+    @property
+    def session(self) -> requests.Session:
+        """Сессия requests с пулом соединений, общая для всех методов"""
+
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Пул потоков, общий для всех пакетных операций"""
+
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _create_session(self) -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=self.IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        if self.metrics_hooks:
+            from metrics import TimingHTTPAdapter as adapter_class
+        else:
+            adapter_class = HTTPAdapter
+        adapter = adapter_class(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                                max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Выполняет запрос через общую сессию с пулом соединений"""
+
+        kwargs.setdefault('timeout', self.timeout)
+        res = self._send(method, url, **kwargs)
+
+        # Ключ, выданный get_api_key, мог протухнуть на сервере: перелогиниваемся и повторяем
+        # запрос, если его тело можно отправить ещё раз (потоковое тело MultipartStream
+        # перематывается к началу, другие потоковые тела уже прочитаны)
+        auth_key = kwargs.get('headers', {}).get('auth_key')
+        if res.status_code == 403 and auth_key in self._key_owners:
+            new_key = self._refresh_api_key(auth_key)
+            data = kwargs.get('data')
+            if new_key is not None and (not hasattr(data, 'read') or hasattr(data, 'rewind')):
+                if hasattr(data, 'rewind'):
+                    data.rewind()
+                res.close()
+                kwargs['headers'] = {**kwargs['headers'], 'auth_key': new_key}
+                res = self._send(method, url, **kwargs)
+
+        # Успешное изменение питомцев делает закэшированные списки этого ключа устаревшими
+        if self.response_cache is not None and method != 'GET' and auth_key and res.ok:
+            self.response_cache.invalidate(auth_key)
+            self.response_cache.invalidate(kwargs['headers']['auth_key'])
+        return res
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        from requests.exceptions import RequestException
+
+        if self.cassette is not None:
+            res = self.cassette.play(method, url, **kwargs)
+            if res is not None:
+                return res
+        if self.throttle is None:
+            return self._transport(method, url, **kwargs)
+
+        from metrics import endpoint_of
+
+        endpoint = endpoint_of(method, urlsplit(url).path)
+        self.throttle.before(endpoint)
+        try:
+            res = self._transport(method, url, **kwargs)
+        except RequestException:
+            self.throttle.after(endpoint)
+            raise
+        self.throttle.after(endpoint, res.status_code, self._retry_after(res))
+        return res
+
+    def _transport(self, method: str, url: str, **kwargs) -> requests.Response:
+        if self.metrics_hooks:
+            from metrics import timed_request
+
+            res = timed_request(self.session, self.metrics_hooks, method, url, **kwargs)
+        else:
+            res = self.session.request(method, url, **kwargs)
+        if self.cassette is not None:
+            self.cassette.record(method, url, res, **kwargs)
+        return res
+
+    @staticmethod
+    def _retry_after(res: requests.Response) -> float:
+        """Значение заголовка Retry-After в секундах, если сервер его прислал"""
+
+        try:
+            return float(res.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _api_key_cache_key(email: str, passwd: str) -> str:
+        # Пароль не хранится в кэше в открытом виде
+        return hashlib.sha256(f"{email}\n{passwd}".encode()).hexdigest()
+
+    def _api_key_lock(self, cache_key: str) -> threading.RLock:
+        with self._key_locks_guard:
+            return self._key_locks.setdefault(cache_key, threading.RLock())
+
+    def _load_api_keys(self) -> dict:
+        """Загружает непротухшие ключи из key_cache_file"""
+
+        if not self.key_cache_file or not os.path.exists(self.key_cache_file):
+            return {}
+        try:
+            with open(self.key_cache_file, encoding='utf-8') as file:
+                saved = json.load(file)
+        except (OSError, json.decoder.JSONDecodeError) as e:
+            logger.warning(f"Не удалось прочитать кэш ключей {self.key_cache_file}: {e}")
+            return {}
+        now = time.time()
+        return {cache_key: {'result': {'key': entry['key']}, 'expires': entry['expires']}
+                for cache_key, entry in saved.items() if entry['expires'] > now}
+
+    def _save_api_keys(self):
+        """Атомарно сохраняет ключи в key_cache_file"""
+
+        if not self.key_cache_file:
+            return
+        saved = {cache_key: {'key': entry['result']['key'], 'expires': entry['expires']}
+                 for cache_key, entry in list(self._api_keys.items())}
+        tmp_file = f"{self.key_cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as file:
+            json.dump(saved, file)
+        os.replace(tmp_file, self.key_cache_file)
+
+    def _refresh_api_key(self, old_key: str) -> str:
+        """Получает новый ключ взамен отвергнутого сервером old_key и возвращает его, либо None.
+        Если другой поток уже обновил этот ключ, новый запрос к серверу не делается"""
+
+        email, passwd = self._key_owners[old_key]
+        cache_key = self._api_key_cache_key(email, passwd)
+        with self._api_key_lock(cache_key):
+            entry = self._api_keys.get(cache_key)
+            if entry is not None and entry['result']['key'] != old_key and entry['expires'] > time.time():
+                return entry['result']['key']
+            if entry is not None:
+                entry['expires'] = 0
+            status, result = self.get_api_key(email, passwd)
+        return result['key'] if status == 200 else None
 
     def get_api_key(self, email: str, passwd: str) -> json:
         """Метод делает запрос к API сервера и возвращает статус запроса и результат в формате
-        JSON с уникальным ключем пользователя, найденного по указанным email и паролем"""
+        JSON с уникальным ключем пользователя, найденного по указанным email и паролем.
+
+        Полученный ключ кэшируется на key_ttl секунд: повторные вызовы с теми же email и паролем
+        возвращают тот же словарь без запроса к серверу, а одновременные вызовы из разных потоков
+        дожидаются одного общего запроса. При обновлении ключа словарь меняется на месте,
+        поэтому все, кто держит ссылку на него, сразу получают новый ключ"""
+
+        if not self.key_ttl:
+            return self._login(email, passwd)
+
+        cache_key = self._api_key_cache_key(email, passwd)
+        with self._api_key_lock(cache_key):
+            entry = self._api_keys.get(cache_key)
+            if entry is None or entry['expires'] <= time.time():
+                status, result = self._login(email, passwd)
+                if status != 200 or not isinstance(result, dict) or 'key' not in result:
+                    return status, result
+                if entry is None:
+                    entry = self._api_keys[cache_key] = {'result': result}
+                else:
+                    self._move_pet_indexes(entry['result']['key'], result['key'])
+                    entry['result'].update(result)
+                entry['expires'] = time.time() + self.key_ttl
+                self._save_api_keys()
+            self._key_owners[entry['result']['key']] = (email, passwd)
+            return 200, entry['result']
+
+    def _login(self, email: str, passwd: str) -> tuple:
+        """Запрашивает у сервера новый ключ, минуя кэш"""
 
         headers = {
             'email': email,
             'password': passwd,
         }
-        res = requests.get(self.base_url+'api/key', headers=headers)
+        res = self._request('GET', self.base_url+'api/key', headers=headers)
         status = res.status_code
         result = ""
         try:
@@ -27,50 +419,132 @@ class PetFriends:
         except json.decoder.JSONDecodeError:
             result = res.text
 
-        logging.info(f"Ответ сервера: {result}")
+        logger.info(f"Ответ сервера: {result}")
         return status, result
 
     def get_list_of_pets(self, auth_key: json, filter: str = "") -> json:
         """Метод делает запрос к API сервера и возвращает статус запроса и результат в формате JSON
         со списком найденных питомцев, совпадающих с фильтром. На данный момент фильтр может иметь
         либо пустое значение - получить список всех питомцев, либо 'my_pets' - получить список
-        собственных питомцев"""
+        собственных питомцев.
+
+        Если задан response_cache, ответ берётся из кэша: при наличии ETag или Last-Modified он
+        перепроверяется условным запросом, иначе считается свежим response_cache.ttl секунд.
+        Закэшированный результат общий для всех вызовов, изменять его нельзя"""
 
         headers = {'auth_key': auth_key['key']}
+        cache_key = (auth_key['key'], filter)
         filter = {'filter': filter}
 
-        res = requests.get(self.base_url + 'api/pets', headers=headers, params=filter)
+        entry = None
+        if self.response_cache is not None:
+            entry = self.response_cache.get(cache_key)
+            if entry is not None:
+                if not entry['etag'] and not entry['last_modified']:
+                    if time.monotonic() - entry['stored'] < self.response_cache.ttl:
+                        return entry['status'], entry['result']
+                    entry = None
+                if entry is not None and entry['etag']:
+                    headers['If-None-Match'] = entry['etag']
+                if entry is not None and entry['last_modified']:
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+        res = self._request('GET', self.base_url + 'api/pets', headers=headers, params=filter)
+        if entry is not None and res.status_code == 304:
+            return entry['status'], entry['result']
+
         status = res.status_code
         result = ""
         try:
-            result = res.json()
+            result = PetList.from_json(res.content) if self.use_models and status == 200 else res.json()
         except json.decoder.JSONDecodeError:
             result = res.text
+
+        if self.response_cache is not None and status == 200:
+            self.response_cache.put(cache_key, {
+                'status': status,
+                'result': result,
+                'etag': res.headers.get('ETag'),
+                'last_modified': res.headers.get('Last-Modified'),
+                'size': len(res.content),
+                'stored': time.monotonic(),
+            })
         return status, result
 
+    def iter_pets(self, auth_key: dict, filter: str = "", chunk_size: int = 64 * 1024):
+        """Метод делает тот же запрос, что и get_list_of_pets, но не загружает весь ответ в память:
+        массив pets разбирается по мере чтения ответа и питомцы отдаются по одному. Если перестать
+        итерироваться раньше (break, islice), соединение закрывается без скачивания остатка ответа
+        (кассета в режиме записи при этом сохраняет только прочитанную часть ответа).
+        При статусе ответа, отличном от 2xx, выбрасывается requests.HTTPError"""
+
+        headers = {'auth_key': auth_key['key']}
+        filter = {'filter': filter}
+
+        res = self._request('GET', self.base_url + 'api/pets', headers=headers, params=filter, stream=True)
+        try:
+            res.raise_for_status()
+            decoder = codecs.getincrementaldecoder(res.encoding or 'utf-8')()
+            json_decoder = json.JSONDecoder()
+            buffer = ''
+            in_array = False
+            for chunk in res.iter_content(chunk_size):
+                buffer += decoder.decode(chunk)
+                if not in_array:
+                    match = PETS_ARRAY_START.search(buffer)
+                    if match is None:
+                        # Хвост оставляем на случай, если "pets" разрезано между кусками
+                        buffer = buffer[-16:]
+                        continue
+                    buffer = buffer[match.end():]
+                    in_array = True
+
+                pos = 0
+                while True:
+                    # Пропускаем пробелы и запятые между элементами массива
+                    while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                        pos += 1
+                    if pos < len(buffer) and buffer[pos] == ']':
+                        return
+                    try:
+                        pet, pos = json_decoder.raw_decode(buffer, pos)
+                    except json.decoder.JSONDecodeError:
+                        # Объект ещё не пришёл целиком - дочитываем следующий кусок
+                        break
+                    yield Pet.from_dict(pet) if self.use_models else pet
+                buffer = buffer[pos:]
+        finally:
+            res.close()
+
     def add_new_pet(self, auth_key: json, name: str, animal_type: str,
-                    age: str, pet_photo: str) -> json:
+                    age: str, pet_photo: str | bytes | memoryview | PetPhoto) -> json:
         """Метод отправляет (постит) на сервер данные о добавляемом питомце и возвращает статус
-        запроса на сервер и результат в формате JSON с данными добавленного питомца"""
+        запроса на сервер и результат в формате JSON с данными добавленного питомца.
+        pet_photo - путь к файлу, байтовый буфер либо заранее загруженный PetPhoto"""
 
-        data = MultipartEncoder(
-            fields={
-                'name': name,
-                'animal_type': animal_type,
-                'age': age,
-                'pet_photo': (pet_photo, open(pet_photo, 'rb'), 'image/jpeg')
-            })
-        headers = {'auth_key': auth_key['key'], 'Content-Type': data.content_type}
+        photo, owned = self._open_photo(pet_photo)
+        try:
+            data = MultipartStream(
+                fields={
+                    'name': name,
+                    'animal_type': animal_type,
+                    'age': age,
+                    'pet_photo': photo
+                })
+            headers = {'auth_key': auth_key['key'], 'Content-Type': data.content_type}
 
-        res = requests.post(self.base_url + 'api/pets', headers=headers, data=data)
+            res = self._request('POST', self.base_url + 'api/pets', headers=headers, data=data)
+        finally:
+            if owned:
+                photo.close()
         status = res.status_code
         result = ""
         try:
             result = res.json()
         except json.decoder.JSONDecodeError:
             result = res.text
-        print(result)
-        return status, result
+        logger.info(f"Ответ сервера: {result}")
+        return status, self._pet_result(auth_key, status, result)
 
     def delete_pet(self, auth_key: json, pet_id: str) -> json:
         """Метод отправляет на сервер запрос на удаление питомца по указанному ID и возвращает
@@ -79,13 +553,16 @@ class PetFriends:
 
         headers = {'auth_key': auth_key['key']}
 
-        res = requests.delete(self.base_url + 'api/pets/' + pet_id, headers=headers)
+        res = self._request('DELETE', self.base_url + 'api/pets/' + pet_id, headers=headers)
         status = res.status_code
         result = ""
         try:
             result = res.json()
         except json.decoder.JSONDecodeError:
             result = res.text
+        if status == 200:
+            for index in self._indexes_of(auth_key):
+                index.remove(pet_id)
         return status, result
 
     def update_pet_info(self, auth_key: json, pet_id: str, name: str,
@@ -100,14 +577,14 @@ class PetFriends:
             'animal_type': animal_type
         }
 
-        res = requests.put(self.base_url + 'api/pets/' + pet_id, headers=headers, data=data)
+        res = self._request('PUT', self.base_url + 'api/pets/' + pet_id, headers=headers, data=data)
         status = res.status_code
         result = ""
         try:
             result = res.json()
         except json.decoder.JSONDecodeError:
             result = res.text
-        return status, result
+        return status, self._pet_result(auth_key, status, result)
 
 
     def add_new_pet_no_photo(self, auth_key: dict, name: str, animal_type: str, age: str) -> tuple:
@@ -115,12 +592,14 @@ class PetFriends:
         Метод отправляет на сервер данные о добавляемом питомце без фотографии и возвращает статус
         запроса на сервер и результат в формате JSON с данными добавленного питомца.
         """
+        import requests
+
         # Проверка входных данных
         if not isinstance(name, str) or not isinstance(animal_type, str) or not isinstance(age, str):
             raise ValueError("Все параметры (name, animal_type, age) должны быть строками")
 
         # Подготовка данных
-        data = MultipartEncoder(
+        data = MultipartStream(
             fields={
                 'name': name,
                 'animal_type': animal_type,
@@ -130,54 +609,155 @@ class PetFriends:
 
         # Отправка запроса
         try:
-            res = requests.post(self.base_url + 'api/create_pet_simple', headers=headers, data=data)
+            res = self._request('POST', self.base_url + 'api/create_pet_simple', headers=headers, data=data)
             res.raise_for_status()  # Проверка на ошибки 4xx/5xx
             status = res.status_code
             result = res.json()
         except requests.exceptions.RequestException as e:
-            logging.error(f"Ошибка при выполнении запроса: {e}")
-            status = None
-            result = str(e)
+            logger.error(f"Ошибка при выполнении запроса: {e}")
+            status, result = self._error_result(e)
         except json.decoder.JSONDecodeError:
-            logging.warning("Ответ сервера не может быть декодирован как JSON")
+            logger.warning("Ответ сервера не может быть декодирован как JSON")
             status = res.status_code
             result = res.text
 
-        logging.info(f"Ответ сервера: {result}")
-        return status, result
+        logger.info(f"Ответ сервера: {result}")
+        return status, self._pet_result(auth_key, status, result)
 
-    def post_new_photo_of_pet(self, auth_key: dict, pet_id: str, pet_photo: str) -> tuple[int, dict | str]:
+    def post_new_photo_of_pet(self, auth_key: dict, pet_id: str,
+                              pet_photo: str | bytes | memoryview | PetPhoto) -> tuple[int, dict | str]:
         """Метод отправляет на сервер данные о добавлении фото питомца и возвращает статус
-        запроса на сервер и результат в формате JSON с данными добавленного питомца"""
+        запроса на сервер и результат в формате JSON с данными добавленного питомца.
+        pet_photo - путь к файлу, байтовый буфер либо заранее загруженный PetPhoto"""
+        import requests
 
-               # Открытие файла и формирование данных
-        with open(pet_photo, 'rb') as file:
-            data = MultipartEncoder(
+        # Открытие файла и формирование данных
+        photo, owned = self._open_photo(pet_photo)
+        try:
+            data = MultipartStream(
                 fields={
                     'pet_id': pet_id,
-                    'pet_photo': (pet_photo, file, 'image/jpeg')
+                    'pet_photo': photo
                 })
             headers = {'auth_key': auth_key['key'], 'Content-Type': data.content_type}
 
             # Выполнение запроса
             try:
-                res = requests.post(self.base_url + f'/api/pets/set_photo/{pet_id}', headers=headers, data=data)
+                res = self._request('POST', self.base_url + f'/api/pets/set_photo/{pet_id}', headers=headers, data=data)
                 res.raise_for_status()  # Проверка на ошибки 4xx/5xx
             except requests.exceptions.RequestException as e:
-                print(f"Ошибка при выполнении запроса: {e}")
-                return None
+                logger.error(f"Ошибка при выполнении запроса: {e}")
+                return self._error_result(e)
+        finally:
+            if owned:
+                photo.close()
 
-            # Обработка ответа
-            status = res.status_code
-            try:
-                result = res.json()
-            except requests.exceptions.JSONDecodeError:
-                result = res.text
-            print(result)
-            return status, result
+        # Обработка ответа
+        status = res.status_code
+        try:
+            result = res.json()
+        except json.decoder.JSONDecodeError:
+            result = res.text
+        logger.info(f"Ответ сервера: {result}")
+        return status, self._pet_result(auth_key, status, result)
+
+    @staticmethod
+    def _error_result(e: requests.exceptions.RequestException) -> tuple:
+        """(статус, текст ответа) для ошибки 4xx/5xx, (None, текст ошибки), если ответа нет
+        (сервер недоступен или разомкнут предохранитель)"""
+
+        if e.response is not None:
+            return e.response.status_code, e.response.text
+        return None, str(e)
+
+    def _pet_result(self, auth_key: dict, status: int, result):
+        """Превращает словарь питомца из успешного ответа в Pet, если включён use_models,
+        и обновляет им индексы, построенные index_pets с тем же ключом"""
+
+        if status == 200 and isinstance(result, dict) and 'id' in result:
+            if self.use_models:
+                result = Pet.from_dict(result)
+            for index in self._indexes_of(auth_key):
+                index.add(result)
+        return result
+
+    def index_pets(self, auth_key: dict, filter: str = "my_pets") -> PetIndex:
+        """Метод загружает список питомцев (потоково, через iter_pets) и возвращает PetIndex по нему.
+        Пока на индекс есть ссылки, успешные add_new_pet, add_new_pet_no_photo, update_pet_info,
+        post_new_photo_of_pet и delete_pet с этим auth_key сразу отражаются в индексе"""
+
+        index = PetIndex(self.iter_pets(auth_key, filter))
+        with self._pet_indexes_lock:
+            self._pet_indexes.setdefault(auth_key['key'], weakref.WeakSet()).add(index)
+        return index
+
+    def _indexes_of(self, auth_key: dict) -> list:
+        """Снимок индексов ключа: обход WeakSet не должен пересекаться с index_pets в другом потоке"""
+
+        with self._pet_indexes_lock:
+            return list(self._pet_indexes.get(auth_key['key'], ()))
+
+    def _move_pet_indexes(self, old_key: str, new_key: str):
+        """Переносит индексы на обновлённый ключ: get_api_key меняет ключ в словаре auth_key на месте,
+        и следующие изменения питомцев уже идут с новым ключом"""
+
+        with self._pet_indexes_lock:
+            indexes = self._pet_indexes.pop(old_key, None)
+            if indexes:
+                self._pet_indexes.setdefault(new_key, weakref.WeakSet()).update(indexes)
+
+    def _open_photo(self, pet_photo) -> tuple:
+        """Возвращает PetPhoto для загрузки и признак того, что его нужно закрыть после запроса"""
+
+        if isinstance(pet_photo, PetPhoto):
+            photo, owned = pet_photo, False
+        else:
+            photo, owned = PetPhoto(pet_photo), True
+        if self.photo_preprocessor is None:
+            return photo, owned
+        try:
+            return self.photo_preprocessor.prepare(photo), True
+        finally:
+            if owned:
+                photo.close()
+
+    def _submit_batch(self, func, items, make_args) -> BatchResult:
+        """Отправляет запросы в пул потоков: для каждого элемента items вызывается
+        func(*make_args(item))"""
+
+        executor = self.executor
+        futures = {executor.submit(func, *make_args(item)): item for item in items}
+        return BatchResult(futures)
+
+    def add_pets(self, auth_key: dict, pets) -> BatchResult:
+        """Метод параллельно добавляет питомцев. pets - итерируемый набор словарей с ключами
+        name, animal_type, age и необязательным pet_photo. Питомцы с фото добавляются через
+        add_new_pet, без фото - через add_new_pet_no_photo"""
+
+        def add(pet: dict) -> tuple:
+            if pet.get('pet_photo') is not None:
+                return self.add_new_pet(auth_key, pet['name'], pet['animal_type'], pet['age'],
+                                        pet['pet_photo'])
+            return self.add_new_pet_no_photo(auth_key, pet['name'], pet['animal_type'], pet['age'])
+
+        return self._submit_batch(add, pets, lambda pet: (pet,))
 
+    def delete_pets(self, auth_key: dict, pet_ids) -> BatchResult:
+        """Метод параллельно удаляет питомцев по списку ID"""
 
+        return self._submit_batch(self.delete_pet, pet_ids, lambda pet_id: (auth_key, pet_id))
 
+    def update_pets(self, auth_key: dict, pets) -> BatchResult:
+        """Метод параллельно обновляет данные питомцев. pets - итерируемый набор словарей
+        с ключами id, name, animal_type, age"""
 
+        return self._submit_batch(self.update_pet_info, pets,
+                                  lambda pet: (auth_key, pet['id'], pet['name'], pet['animal_type'], pet['age']))
 
+    def run_workflow(self, auth_key: dict, workflow: Workflow, pets) -> BatchResult:
+        """Метод параллельно выполняет цепочку шагов workflow (см. workflow.py) для каждого
+        питомца из pets - итерируемого набора словарей с аргументами шагов (name, animal_type, age,
+        pet_photo, id). При итерации результата отдаются кортежи (питомец, статус, ChainResult)
+        с результатами и временем каждого шага"""
 
+        return self._submit_batch(workflow.run_chain, pets, lambda pet: (self, auth_key, pet))
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPetFriends:
+    """асинхронная апи библиотека к веб приложению Pet Friends. Повторяет методы PetFriends,
+    но все они являются корутинами и возвращают тот же результат (status, result)"""
+
+    def __init__(self, base_url: str = "https://petfriends.skillfactory.ru/", pool_size: int = 100,
+                 limit_per_host: int = 0, concurrency: int = 100, timeout: float = 30,
+                 keepalive_timeout: float = 15):
+        """base_url - адрес сервера Pet Friends;
+        pool_size - общее количество соединений в пуле;
+        limit_per_host - максимальное количество соединений к одному хосту (0 - без ограничения);
+        concurrency - сколько запросов могут выполняться одновременно;
+        timeout - общий таймаут на запрос в секундах;
+        keepalive_timeout - сколько секунд держать простаивающее соединение открытым"""
+
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """Закрывает все соединения из пула"""
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессия создаётся лениво, т.к. ей нужен запущенный event loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def _request(self, method: str, url: str, error_as_text: bool = False, **kwargs) -> tuple:
+        """Выполняет запрос через общий пул соединений и возвращает статус и результат
+        в формате JSON, либо текст ответа, если его нельзя декодировать как JSON.
+        error_as_text - для ответа 4xx/5xx вернуть текст ответа без разбора, как PetFriends"""
+
+        async with self.semaphore:
+            async with self._get_session().request(method, url, **kwargs) as res:
+                status = res.status
+                text = await res.text()
+        if error_as_text and status >= 400:
+            logger.error(f"Ошибка при выполнении запроса: {status} {text}")
+            return status, text
+        try:
+            result = json.loads(text)
+        except json.decoder.JSONDecodeError:
+            result = text
+        return status, result
+
+    async def get_api_key(self, email: str, passwd: str) -> tuple:
+        """Метод делает запрос к API сервера и возвращает статус запроса и результат в формате
+        JSON с уникальным ключем пользователя, найденного по указанным email и паролем"""
+
+        headers = {
+            'email': email,
+            'password': passwd,
+        }
+        status, result = await self._request('GET', self.base_url + 'api/key', headers=headers)
+
+        logger.info(f"Ответ сервера: {result}")
+        return status, result
+
+    async def get_list_of_pets(self, auth_key: dict, filter: str = "") -> tuple:
+        """Метод делает запрос к API сервера и возвращает статус запроса и результат в формате JSON
+        со списком найденных питомцев, совпадающих с фильтром ('' либо 'my_pets')"""
+
+        headers = {'auth_key': auth_key['key']}
+        filter = {'filter': filter}
+
+        return await self._request('GET', self.base_url + 'api/pets', headers=headers, params=filter)
+
+    async def add_new_pet(self, auth_key: dict, name: str, animal_type: str,
+                          age: str, pet_photo: str) -> tuple:
+        """Метод отправляет (постит) на сервер данные о добавляемом питомце и возвращает статус
+        запроса на сервер и результат в формате JSON с данными добавленного питомца"""
+
+        headers = {'auth_key': auth_key['key']}
+        with open(pet_photo, 'rb') as file:
+            data = aiohttp.FormData()
+            data.add_field('name', name)
+            data.add_field('animal_type', animal_type)
+            data.add_field('age', age)
+            data.add_field('pet_photo', file, filename=pet_photo, content_type='image/jpeg')
+
+            return await self._request('POST', self.base_url + 'api/pets', headers=headers, data=data)
+
+    async def delete_pet(self, auth_key: dict, pet_id: str) -> tuple:
+        """Метод отправляет на сервер запрос на удаление питомца по указанному ID и возвращает
+        статус запроса и результат в формате JSON с текстом уведомления о успешном удалении"""
+
+        headers = {'auth_key': auth_key['key']}
+
+        return await self._request('DELETE', self.base_url + 'api/pets/' + pet_id, headers=headers)
+
+    async def update_pet_info(self, auth_key: dict, pet_id: str, name: str,
+                              animal_type: str, age: int) -> tuple:
+        """Метод отправляет запрос на сервер об обновлении данных питомца по указанному ID и
+        возвращает статус запроса и result в формате JSON с обновлённыими данными питомца"""
+
+        headers = {'auth_key': auth_key['key']}
+        data = {
+            'name': name,
+            'age': str(age),
+            'animal_type': animal_type
+        }
+
+        return await self._request('PUT', self.base_url + 'api/pets/' + pet_id, headers=headers, data=data)
+
+    async def add_new_pet_no_photo(self, auth_key: dict, name: str, animal_type: str, age: str) -> tuple:
+        """Метод отправляет на сервер данные о добавляемом питомце без фотографии и возвращает статус
+        запроса на сервер и результат в формате JSON с данными добавленного питомца"""
+
+        if not isinstance(name, str) or not isinstance(animal_type, str) or not isinstance(age, str):
+            raise ValueError("Все параметры (name, animal_type, age) должны быть строками")
+
+        headers = {'auth_key': auth_key['key']}
+        # Как и в PetFriends, данные уходят в формате multipart/form-data
+        data = aiohttp.FormData(default_to_multipart=True)
+        data.add_field('name', name)
+        data.add_field('animal_type', animal_type)
+        data.add_field('age', age)
+
+        try:
+            status, result = await self._request('POST', self.base_url + 'api/create_pet_simple',
+                                                 error_as_text=True, headers=headers, data=data)
+        except aiohttp.ClientError as e:
+            # Ответа нет (сервер недоступен)
+            logger.error(f"Ошибка при выполнении запроса: {e}")
+            status, result = None, str(e)
+
+        logger.info(f"Ответ сервера: {result}")
+        return status, result
+
+    async def post_new_photo_of_pet(self, auth_key: dict, pet_id: str, pet_photo: str) -> tuple[int, dict | str]:
+        """Метод отправляет на сервер данные о добавлении фото питомца и возвращает статус
+        запроса на сервер и результат в формате JSON с данными добавленного питомца"""
+
+        headers = {'auth_key': auth_key['key']}
+        with open(pet_photo, 'rb') as file:
+            data = aiohttp.FormData()
+            data.add_field('pet_id', pet_id)
+            data.add_field('pet_photo', file, filename=pet_photo, content_type='image/jpeg')
+
+            try:
+                status, result = await self._request('POST', self.base_url + f'api/pets/set_photo/{pet_id}',
+                                                     error_as_text=True, headers=headers, data=data)
+            except aiohttp.ClientError as e:
+                # Ответа нет (сервер недоступен)
+                logger.error(f"Ошибка при выполнении запроса: {e}")
+                status, result = None, str(e)
+
+        logger.info(f"Ответ сервера: {result}")
+        return status, result
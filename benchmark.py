@@ -0,0 +1,340 @@
+"""Нагрузочный прогон методов PetFriends.
+
+Пример запуска против локального сервера:
+    python benchmark.py --base-url http://127.0.0.1:8000/ --concurrency 20 --duration 10 \
+        --mix get_list_of_pets=5,add_new_pet_no_photo=2,update_pet_info=2,delete_pet=1
+
+Время импорта модуля api (лучшее из нескольких запусков нового интерпретатора):
+    python benchmark.py --import-time
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from api import PetFriends
+from photos import PetPhoto
+from settings import valid_email, valid_password
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIX = {
+    'get_api_key': 1,
+    'get_list_of_pets': 4,
+    'add_new_pet_no_photo': 2,
+    'update_pet_info': 2,
+    'delete_pet': 1,
+}
+
+
+def percentile(sorted_values: list, percent: float) -> float:
+    """Перцентиль по методу ближайшего ранга для отсортированного списка"""
+
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class OperationStats:
+    """Задержки и ошибки одной операции"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies)
+
+    def to_dict(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'error_rate': self.errors / self.count if self.count else 0.0,
+            'rps': self.count / elapsed if elapsed else 0.0,
+            'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+
+
+class BenchmarkReport:
+    """Итоги прогона по каждой операции и в сумме"""
+
+    def __init__(self, stats: dict, elapsed: float):
+        self.stats = stats
+        self.elapsed = elapsed
+
+    def to_dict(self) -> dict:
+        total = OperationStats('total')
+        for stats in self.stats.values():
+            total.latencies += stats.latencies
+            total.errors += stats.errors
+        operations = {name: stats.to_dict(self.elapsed) for name, stats in self.stats.items()}
+        return {'elapsed_s': self.elapsed, 'operations': operations, 'total': total.to_dict(self.elapsed)}
+
+    def format(self) -> str:
+        """Таблица с результатами для вывода в консоль"""
+
+        report = self.to_dict()
+        lines = [f"{'operation':<22}{'count':>8}{'errors':>8}{'err %':>8}{'rps':>10}"
+                 f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+        rows = list(report['operations'].items()) + [('total', report['total'])]
+        for name, row in rows:
+            lines.append(f"{name:<22}{row['count']:>8}{row['errors']:>8}{row['error_rate'] * 100:>8.2f}"
+                         f"{row['rps']:>10.1f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+        lines.append(f"elapsed: {self.elapsed:.2f} s")
+        return '\n'.join(lines)
+
+
+class Benchmark:
+    """Гоняет смесь операций PetFriends либо с фиксированным числом одновременных запросов
+    (concurrency), либо с заданной частотой запросов в секунду (rate).
+
+    В режиме rate задержка считается от запланированного времени старта запроса, поэтому
+    ожидание в очереди при перегрузке сервера тоже попадает в перцентили"""
+
+    def __init__(self, pf: PetFriends, mix: dict = None, email: str = valid_email,
+                 password: str = valid_password, pet_photo: str = None, seed: int = None):
+        """mix - словарь 'операция': вес; pet_photo - фото для add_new_pet"""
+
+        self.pf = pf
+        self.mix = dict(mix or DEFAULT_MIX)
+        unknown = set(self.mix) - set(self.OPERATIONS)
+        if unknown:
+            raise ValueError(f"Неизвестные операции: {', '.join(sorted(unknown))}")
+        if 'add_new_pet' in self.mix and pet_photo is None:
+            raise ValueError("Для операции add_new_pet нужно указать pet_photo")
+        self.email = email
+        self.password = password
+        self.photo = PetPhoto(pet_photo) if pet_photo else None
+        self.random = random.Random(seed)
+        self.auth_key = None
+        # id питомцев, созданных прогоном: из них берутся питомцы для update и delete
+        self.pet_ids = deque()
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    # Каждая операция возвращает (status, result) соответствующего метода PetFriends
+    def _get_api_key(self):
+        return self.pf.get_api_key(self.email, self.password)
+
+    def _get_list_of_pets(self):
+        return self.pf.get_list_of_pets(self.auth_key, 'my_pets')
+
+    def _add_new_pet(self):
+        return self._remember(self.pf.add_new_pet(self.auth_key, 'Бенч', 'кот', '1', self.photo))
+
+    def _add_new_pet_no_photo(self):
+        return self._remember(self.pf.add_new_pet_no_photo(self.auth_key, 'Бенч', 'кот', '1'))
+
+    # Операции с питомцем получают его id, взятый до начала замера (см. _run_operation)
+    def _update_pet_info(self, pet_id: str):
+        try:
+            return self.pf.update_pet_info(self.auth_key, pet_id, 'Бенч2', 'кот', 2)
+        finally:
+            self.pet_ids.append(pet_id)
+
+    def _delete_pet(self, pet_id: str):
+        return self.pf.delete_pet(self.auth_key, pet_id)
+
+    OPERATIONS = {
+        'get_api_key': _get_api_key,
+        'get_list_of_pets': _get_list_of_pets,
+        'add_new_pet': _add_new_pet,
+        'add_new_pet_no_photo': _add_new_pet_no_photo,
+        'update_pet_info': _update_pet_info,
+        'delete_pet': _delete_pet,
+    }
+    PET_OPERATIONS = frozenset(['update_pet_info', 'delete_pet'])
+
+    def _remember(self, response: tuple) -> tuple:
+        status, result = response
+        # Питомец может быть словарём или models.Pet (PetFriends(use_models=True))
+        if status == 200 and hasattr(result, 'get') and result.get('id') is not None:
+            self.pet_ids.append(result['id'])
+        return response
+
+    def _take_pet_id(self) -> str:
+        """Берёт созданного прогоном питомца, а если их нет - создаёт нового. Вызывается до
+        начала замера операции. Возвращает None, если питомца создать не удалось"""
+
+        try:
+            return self.pet_ids.popleft()
+        except IndexError:
+            status, result = self.pf.add_new_pet_no_photo(self.auth_key, 'Бенч', 'кот', '1')
+        if status != 200 or not hasattr(result, 'get') or result.get('id') is None:
+            logger.warning(f"Не удалось создать питомца для операции: {status} {result}")
+            return None
+        return result['id']
+
+    def _seed_pets(self, count: int):
+        """Создаёт count питомцев для update_pet_info и delete_pet до начала прогона"""
+
+        pets = [{'name': 'Бенч', 'animal_type': 'кот', 'age': '1'}] * count
+        for _, status, result in self.pf.add_pets(self.auth_key, pets):
+            self._remember((status, result))
+
+    def _run_operation(self, name: str, scheduled: float = None):
+        operation = self.OPERATIONS[name]
+        args = ()
+        setup = 0.0
+        if name in self.PET_OPERATIONS:
+            setup_start = time.perf_counter()
+            pet_id = self._take_pet_id()
+            if pet_id is None:
+                # Операцию не с чем выполнить: в замеры она не попадает
+                return
+            args = (pet_id,)
+            setup = time.perf_counter() - setup_start
+        start = time.perf_counter()
+        try:
+            status, _ = operation(self, *args)
+        except Exception:
+            status = None
+        # В режиме rate задержка считается от запланированного старта, но без создания питомца
+        latency = time.perf_counter() - (scheduled + setup if scheduled is not None else start)
+        with self._stats_lock:
+            stats = self.stats.setdefault(name, OperationStats(name))
+            stats.latencies.append(latency)
+            if status != 200:
+                stats.errors += 1
+
+    def _choose(self) -> str:
+        return self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+
+    def run(self, concurrency: int = 10, duration: float = 10, requests: int = None,
+            rate: float = None) -> BenchmarkReport:
+        """Запускает прогон на duration секунд (или до requests запросов) и возвращает отчёт.
+        Если rate не задан, concurrency потоков шлют запросы друг за другом без пауз,
+        иначе запросы стартуют с частотой rate в секунду, не более concurrency одновременно"""
+
+        status, self.auth_key = self.pf.get_api_key(self.email, self.password)
+        if status != 200:
+            raise RuntimeError(f"Не удалось получить ключ: {status} {self.auth_key}")
+        self.stats = {}
+        if self.PET_OPERATIONS & set(self.mix):
+            self._seed_pets(concurrency)
+
+        deadline = time.perf_counter() + duration
+        counter = iter(range(requests)) if requests is not None else None
+        counter_lock = threading.Lock()
+
+        def has_budget() -> bool:
+            if time.perf_counter() >= deadline:
+                return False
+            if counter is None:
+                return True
+            with counter_lock:
+                return next(counter, None) is not None
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if rate is None:
+                def worker():
+                    while has_budget():
+                        self._run_operation(self._choose())
+
+                for _ in range(concurrency):
+                    executor.submit(worker)
+            else:
+                sent = 0
+                while has_budget():
+                    scheduled = start + sent / rate
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    executor.submit(self._run_operation, self._choose(), scheduled)
+                    sent += 1
+        elapsed = time.perf_counter() - start
+
+        # Очистка: удаляем питомцев, оставшихся после прогона
+        self.pf.delete_pets(self.auth_key, list(self.pet_ids)).wait()
+        self.pet_ids.clear()
+        return BenchmarkReport(self.stats, elapsed)
+
+    def close(self):
+        if self.photo is not None:
+            self.photo.close()
+
+
+def import_time(module: str = 'api', repeat: int = 5) -> dict:
+    """Импортирует module в repeat новых интерпретаторах и возвращает лучшее время импорта
+    в секундах и список модулей верхнего уровня, которые были загружены вместе с ним"""
+
+    code = ("import json, sys, time\n"
+            "before = set(sys.modules)\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "elapsed = time.perf_counter() - start\n"
+            "loaded = sorted({name.partition('.')[0] for name in set(sys.modules) - before})\n"
+            "print(json.dumps({'seconds': elapsed, 'modules': loaded}))")
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def parse_mix(text: str) -> dict:
+    """Разбирает строку вида 'get_list_of_pets=5,delete_pet=1'"""
+
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight) if weight else 1.0
+    return mix
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон API PetFriends")
+    parser.add_argument('--base-url', default="https://petfriends.skillfactory.ru/",
+                        help="адрес сервера, например http://127.0.0.1:8000/ (см. fake_server.py)")
+    parser.add_argument('--email', default=valid_email)
+    parser.add_argument('--password', default=valid_password)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="веса операций: get_list_of_pets=5,delete_pet=1")
+    parser.add_argument('--concurrency', type=int, default=10, help="одновременных запросов")
+    parser.add_argument('--rate', type=float, help="запросов в секунду (по умолчанию без ограничения)")
+    parser.add_argument('--duration', type=float, default=10, help="длительность прогона в секундах")
+    parser.add_argument('--requests', type=int, help="общее количество запросов")
+    parser.add_argument('--photo', help="фото для операции add_new_pet")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help="вывести отчёт в формате JSON")
+    parser.add_argument('--import-time', action='store_true', help="замерить только время импорта api")
+    args = parser.parse_args(argv)
+
+    if args.import_time:
+        result = import_time('api')
+        print(json.dumps(result, indent=2) if args.json else f"import api: {result['seconds'] * 1000:.1f} ms")
+        return
+
+    # Повторы запросов и кэш ключей отключены, чтобы каждая операция доходила до сервера
+    # и не искажала задержки и количество ошибок
+    with PetFriends(args.base_url, pool_maxsize=args.concurrency, max_retries=0, key_ttl=0) as pf:
+        benchmark = Benchmark(pf, args.mix, args.email, args.password, args.photo, args.seed)
+        try:
+            report = benchmark.run(args.concurrency, args.duration, args.requests, args.rate)
+        finally:
+            benchmark.close()
+
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report.format())
+
+
+if __name__ == '__main__':
+    main()
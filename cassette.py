@@ -0,0 +1,279 @@
+"""Запись запросов PetFriends в файл («кассету») и воспроизведение их без сети.
+
+В режиме record каждый запрос и ответ дописываются в конец файла кассеты, в режиме replay ответы
+берутся из кассеты, а запросы на сервер не отправляются, в режиме auto воспроизводится то, что уже
+записано, а новые запросы отправляются на сервер и дописываются. Одинаковые запросы (например,
+несколько GET api/pets) воспроизводятся в том порядке, в котором были записаны.
+
+Формат: файл кассеты состоит из записей «строка JSON с запросом и заголовками ответа, тело ответа
+(сжатое zlib, если так меньше), перевод строки». Рядом лежит индекс <кассета>.idx со строками
+«смещение<TAB>ключ запроса». При воспроизведении в память читается только индекс, а тела ответов
+читаются из файла по смещению при первом обращении. Если индекса нет, он строится заново по кассете"""
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from photos import PetPhoto
+
+# Заголовки ответа, которые не имеют смысла для уже распакованного тела
+SKIPPED_RESPONSE_HEADERS = frozenset(('content-encoding', 'transfer-encoding', 'content-length', 'connection'))
+# Заголовки запроса, значения которых записываются в кассету только в виде хэша (кроме match_headers)
+SECRET_REQUEST_HEADERS = frozenset(('auth_key', 'password'))
+
+
+class CassetteMiss(RequestsConnectionError):
+    """В кассете нет ответа на запрос, а режим replay не позволяет обратиться к серверу"""
+
+
+def header_digest(value) -> str:
+    return 'sha256:' + hashlib.sha256(str(value).encode()).hexdigest()[:16]
+
+
+class _TeeRaw:
+    """Обёртка над res.raw потокового ответа (stream=True): отдаёт тело по мере чтения и копит
+    прочитанное, чтобы записать его в кассету, когда ответ дочитан или закрыт досрочно"""
+
+    def __init__(self, raw, on_done):
+        self._raw = raw
+        self._on_done = on_done
+        self._chunks = []
+
+    def _done(self):
+        on_done, self._on_done = self._on_done, None
+        if on_done is not None:
+            on_done(b''.join(self._chunks))
+
+    def stream(self, amt: int = 2 ** 16, decode_content: bool = None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._chunks.append(chunk)
+            yield chunk
+        self._done()
+
+    def close(self):
+        self._done()
+        self._raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def body_digest(data) -> str:
+    """sha256 полей тела запроса. Для multipart учитываются имена и значения полей, но не случайный
+    boundary, поэтому одно и то же тело даёт один и тот же хэш"""
+
+    if data is None:
+        return None
+    digest = hashlib.sha256()
+    fields = getattr(data, 'fields', data)
+    if isinstance(fields, dict):
+        for name, value in sorted(fields.items()):
+            if isinstance(value, PetPhoto):
+                value = value.data
+            elif isinstance(value, tuple):
+                # Файл в MultipartEncoder: (имя файла, файл или байты, тип)
+                value = value[1] if isinstance(value[1], (bytes, bytearray)) else str(value[0])
+            digest.update(f"{name}\0".encode())
+            digest.update(value if isinstance(value, (bytes, bytearray, memoryview)) else str(value).encode())
+            digest.update(b'\0')
+    else:
+        digest.update(data if isinstance(data, (bytes, bytearray)) else str(data).encode())
+    return digest.hexdigest()
+
+
+class Cassette:
+    """Кассета с записанными запросами для PetFriends(cassette=...).
+
+    path - файл кассеты; mode - 'record', 'replay' или 'auto';
+    match - по каким частям запроса подбирается ответ: 'method', 'path', 'query', 'body' (хэш
+    полей тела, см. body_digest);
+    match_headers - заголовки запроса, которые тоже учитываются (email и password, чтобы ключ
+    для неверного пароля не воспроизводился как ключ для верного).
+
+    Значения заголовков из match_headers и auth_key в кассете не хранятся, только их хэш. Тела
+    ответов записываются как есть, в том числе ответ api/key с ключом пользователя"""
+
+    MODES = ('record', 'replay', 'auto')
+
+    def __init__(self, path: str, mode: str = 'auto', match: tuple = ('method', 'path', 'query'),
+                 match_headers: tuple = ('email', 'password'), compress_min: int = 256):
+        if mode not in self.MODES:
+            raise ValueError(f"Неизвестный режим кассеты: {mode}")
+        self.path = path
+        self.index_path = path + '.idx'
+        self.mode = mode
+        self.match = tuple(match)
+        self.match_headers = tuple(match_headers)
+        self.compress_min = compress_min
+        self._index = None
+        self._positions = {}
+        self._data = None
+        self._index_file = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for file in (self._data, self._index_file):
+                if file is not None:
+                    file.close()
+            self._data = self._index_file = None
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(offsets) for offsets in self._load_index().values())
+
+    def key(self, method: str, url: str, params=None, headers: dict = None, data=None) -> str:
+        """Ключ, по которому запрос сопоставляется с записанными"""
+
+        url = requests.Request(method, url, params=params).prepare().url
+        parts = urlsplit(url)
+        key = []
+        if 'method' in self.match:
+            key.append(method.upper())
+        if 'path' in self.match:
+            key.append(re.sub('/+', '/', parts.path).strip('/'))
+        if 'query' in self.match:
+            key.append('?' + '&'.join(f"{name}={value}" for name, value in sorted(parse_qsl(parts.query, True))))
+        if 'body' in self.match:
+            key.append(body_digest(data) or '-')
+        headers = CaseInsensitiveDict(headers or {})
+        selected = [f"{name}={headers.get(name)}" for name in self.match_headers if name in headers]
+        if selected:
+            key.append(hashlib.sha256('\n'.join(selected).encode()).hexdigest()[:16])
+        return ' '.join(key)
+
+    def _open(self):
+        if self._data is None:
+            self._data = open(self.path, 'a+b')
+            self._index_file = open(self.index_path, 'a', encoding='utf-8')
+
+    def _load_index(self) -> dict:
+        """Читает индекс кассеты; если его нет или он отстал от кассеты, строит заново"""
+
+        if self._index is not None:
+            return self._index
+        self._index = {}
+        self._open()
+        size = os.fstat(self._data.fileno()).st_size
+        indexed = 0
+        with open(self.index_path, encoding='utf-8') as file:
+            for line in file:
+                offset, _, key = line.rstrip('\n').partition('\t')
+                self._index.setdefault(key, []).append(int(offset))
+                indexed = max(indexed, int(offset))
+
+        if bool(size) != bool(self._index) or size and (indexed >= size or self._record_end(indexed) != size):
+            self._index = {}
+            self._index_file.truncate(0)
+            offset = 0
+            while offset < size:
+                header = self._read_header(offset)
+                self._index.setdefault(header['key'], []).append(offset)
+                self._index_file.write(f"{offset}\t{header['key']}\n")
+                offset = self._record_end(offset)
+            self._index_file.flush()
+        return self._index
+
+    def _read_header(self, offset: int) -> dict:
+        self._data.seek(offset)
+        return json.loads(self._data.readline())
+
+    def _record_end(self, offset: int) -> int:
+        header = self._read_header(offset)
+        return self._data.tell() + header['length'] + 1
+
+    def play(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Ответ из кассеты или None, если запрос нужно отправить на сервер. Когда записанные
+        ответы на такой запрос закончились, в режиме replay повторяется последний из них"""
+
+        if self.mode == 'record':
+            return None
+        key = self.key(method, url, kwargs.get('params'), kwargs.get('headers'), kwargs.get('data'))
+        with self._lock:
+            offsets = self._load_index().get(key)
+            position = self._positions.get(key, 0)
+            if offsets and position < len(offsets):
+                self._positions[key] = position + 1
+            elif offsets and self.mode == 'replay':
+                position = len(offsets) - 1
+            elif self.mode == 'replay':
+                raise CassetteMiss(f"В кассете {self.path} нет ответа на запрос {key}")
+            else:
+                return None
+            header = self._read_header(offsets[position])
+            body = self._data.read(header['length'])
+        if header['compressed']:
+            body = zlib.decompress(body)
+
+        res = requests.Response()
+        res.status_code = header['status']
+        res.reason = header['reason']
+        res.headers = CaseInsensitiveDict(header['headers'])
+        res.encoding = get_encoding_from_headers(res.headers)
+        res.url = header['url']
+        res._content = body
+        res._content_consumed = True
+        return res
+
+    def record(self, method: str, url: str, res: requests.Response, **kwargs):
+        """Дописывает запрос и ответ в кассету. Тело обычного ответа читается сразу, а потокового
+        (stream=True) записывается, когда его дочитают или закроют: если чтение прервали досрочно,
+        в кассету попадает только прочитанная часть"""
+
+        if self.mode == 'replay':
+            return
+        params, headers, data = kwargs.get('params'), kwargs.get('headers'), kwargs.get('data')
+        secret = SECRET_REQUEST_HEADERS | {name.lower() for name in self.match_headers}
+        header = {
+            'key': self.key(method, url, params, headers, data),
+            'method': method,
+            'url': res.url,
+            'request_headers': {name: header_digest(value) if name.lower() in secret else value
+                                for name, value in (headers or {}).items() if name.lower() != 'content-type'},
+            'body_digest': body_digest(data),
+            'status': res.status_code,
+            'reason': res.reason,
+            'headers': {name: value for name, value in res.headers.items()
+                        if name.lower() not in SKIPPED_RESPONSE_HEADERS},
+        }
+        if kwargs.get('stream') and not res._content_consumed:
+            res.raw = _TeeRaw(res.raw, lambda body: self._write(header, body))
+        else:
+            self._write(header, res.content)
+
+    def _write(self, header: dict, body: bytes):
+        compressed = False
+        if len(body) >= self.compress_min:
+            packed = zlib.compress(body)
+            if len(packed) < len(body):
+                body, compressed = packed, True
+        header = {**header, 'compressed': compressed, 'length': len(body)}
+        key = header['key']
+        line = json.dumps(header, ensure_ascii=False).encode() + b'\n'
+
+        with self._lock:
+            index = self._load_index()
+            self._data.seek(0, os.SEEK_END)
+            offset = self._data.tell()
+            self._data.write(line + body + b'\n')
+            self._data.flush()
+            self._index_file.write(f"{offset}\t{key}\n")
+            self._index_file.flush()
+            offsets = index.setdefault(key, [])
+            offsets.append(offset)
+            # Только что записанный ответ не должен воспроизводиться в этом же прогоне
+            self._positions[key] = len(offsets)
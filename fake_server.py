@@ -0,0 +1,334 @@
+"""Локальный сервер, повторяющий API Pet Friends, для быстрых прогонов тестов и бенчмарков
+без сети. Все данные хранятся в памяти процесса.
+
+Пример запуска:
+    python fake_server.py --port 8000 --latency 0.01 --error-rate 0.01
+"""
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from settings import valid_email, valid_password
+
+FORBIDDEN_PAGE = ("<!doctype html><title>403 Forbidden</title><h1>Forbidden</h1>"
+                  "<p>This user wasn&#39;t found in database</p>")
+
+
+class Profile:
+    """Искусственная задержка и ошибки для одного эндпоинта: каждый запрос ждёт
+    latency ± jitter секунд и с вероятностью error_rate получает ответ error_status"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def delay(self) -> float:
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class PetStore:
+    """Пользователи, ключи и питомцы в памяти"""
+
+    def __init__(self, users: dict):
+        self.users = dict(users)
+        self.keys = {}
+        self.pets = {}
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def get_key(self, email: str, password: str) -> str:
+        with self.lock:
+            if not email or self.users.get(email) != password:
+                return None
+            for key, owner in self.keys.items():
+                if owner == email:
+                    return key
+            key = uuid.uuid4().hex + uuid.uuid4().hex[:8]
+            self.keys[key] = email
+            return key
+
+    def owner(self, key: str) -> str:
+        return self.keys.get(key)
+
+    def add_pet(self, owner: str, name: str, animal_type: str, age: str, photo: bytes = None) -> dict:
+        pet = {
+            'id': uuid.uuid4().hex[:24],
+            'name': name,
+            'animal_type': animal_type,
+            'age': age,
+            'pet_photo': self.encode_photo(photo),
+            'user_id': owner,
+            'created_at': f"{time.time():.6f}",
+        }
+        with self.lock:
+            self.pets[pet['id']] = pet
+            self.version += 1
+        return pet
+
+    def update_pet(self, owner: str, pet_id: str, **fields) -> dict:
+        with self.lock:
+            pet = self.pets.get(pet_id)
+            if pet is None or pet['user_id'] != owner:
+                return None
+            pet.update(fields)
+            self.version += 1
+            return dict(pet)
+
+    def delete_pet(self, owner: str, pet_id: str):
+        with self.lock:
+            pet = self.pets.get(pet_id)
+            if pet is not None and pet['user_id'] == owner:
+                del self.pets[pet_id]
+                self.version += 1
+
+    def list_pets(self, owner: str = None) -> list:
+        with self.lock:
+            return [pet for pet in self.pets.values() if owner is None or pet['user_id'] == owner]
+
+    @staticmethod
+    def encode_photo(photo: bytes) -> str:
+        if not photo:
+            return ''
+        return 'data:image/jpeg;base64,' + base64.b64encode(photo).decode()
+
+
+class PetFriendsHandler(BaseHTTPRequestHandler):
+    """Обработчик эндпоинтов api/key, api/pets, api/pets/<id>, api/create_pet_simple
+    и api/pets/set_photo/<id>"""
+
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят одним пакетом, иначе delayed ACK добавляет ~40 мс к ответу
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    ROUTES = [
+        ('GET', re.compile(r'^/api/key$'), 'key', 'get_key'),
+        ('GET', re.compile(r'^/api/pets$'), 'pets', 'list_pets'),
+        ('POST', re.compile(r'^/api/pets$'), 'pets', 'add_pet'),
+        ('POST', re.compile(r'^/api/create_pet_simple$'), 'create_pet_simple', 'add_pet_simple'),
+        ('POST', re.compile(r'^/api/pets/set_photo/(?P<pet_id>[^/]+)$'), 'set_photo', 'set_photo'),
+        ('PUT', re.compile(r'^/api/pets/(?P<pet_id>[^/]+)$'), 'pet', 'update_pet'),
+        ('DELETE', re.compile(r'^/api/pets/(?P<pet_id>[^/]+)$'), 'pet', 'delete_pet'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method: str):
+        url = urlsplit(self.path)
+        # Клиент может прислать путь с двойным слешем (base_url + '/api/...')
+        path = re.sub('/+', '/', url.path)
+        self.query = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+
+        for route_method, pattern, endpoint, handler in self.ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                profile = self.server.profiles.get(endpoint, self.server.default_profile)
+                delay = profile.delay()
+                if delay:
+                    time.sleep(delay)
+                if profile.should_fail():
+                    return self.send_text(profile.error_status, 'Internal Server Error')
+                return getattr(self, handler)(**match.groupdict())
+        self.send_text(404, 'Not Found')
+
+    def send_body(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, data, headers: dict = None):
+        self.send_body(status, json.dumps(data).encode(), 'application/json', headers)
+
+    def send_text(self, status: int, text: str):
+        self.send_body(status, text.encode(), 'text/html; charset=utf-8')
+
+    def authorize(self) -> str:
+        owner = self.server.store.owner(self.headers.get('auth_key'))
+        if owner is None:
+            self.send_text(403, FORBIDDEN_PAGE)
+        return owner
+
+    def form(self) -> dict:
+        """Поля multipart/form-data или application/x-www-form-urlencoded тела запроса"""
+
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + self.body)
+            fields = {}
+            for part in message.iter_parts():
+                payload = part.get_payload(decode=True) or b''
+                name = part.get_param('name', header='content-disposition')
+                fields[name] = payload if part.get_filename() is not None else payload.decode()
+            return fields
+        return {name: values[0] for name, values in parse_qs(self.body.decode(), keep_blank_values=True).items()}
+
+    def get_key(self):
+        key = self.server.store.get_key(self.headers.get('email'), self.headers.get('password'))
+        if key is None:
+            return self.send_text(403, FORBIDDEN_PAGE)
+        self.send_json(200, {'key': key})
+
+    def list_pets(self):
+        owner = self.authorize()
+        if owner is None:
+            return
+        filter = self.query.get('filter', [''])[0]
+        etag = f'"{self.server.store.version}-{filter}"'
+        if self.headers.get('If-None-Match') == etag:
+            return self.send_body(304, b'', 'application/json', {'ETag': etag})
+        pets = self.server.store.list_pets(owner if filter == 'my_pets' else None)
+        self.send_json(200, {'pets': pets}, {'ETag': etag})
+
+    def add_pet(self, photo_required: bool = True):
+        owner = self.authorize()
+        if owner is None:
+            return
+        fields = self.form()
+        if any(name not in fields for name in ('name', 'animal_type', 'age')) or \
+                (photo_required and 'pet_photo' not in fields):
+            return self.send_text(400, 'Bad Request')
+        pet = self.server.store.add_pet(owner, fields['name'], fields['animal_type'], fields['age'],
+                                        fields.get('pet_photo'))
+        self.send_json(200, pet)
+
+    def add_pet_simple(self):
+        self.add_pet(photo_required=False)
+
+    def set_photo(self, pet_id: str):
+        owner = self.authorize()
+        if owner is None:
+            return
+        photo = self.form().get('pet_photo')
+        if not isinstance(photo, bytes):
+            return self.send_text(400, 'Bad Request')
+        pet = self.server.store.update_pet(owner, pet_id, pet_photo=PetStore.encode_photo(photo))
+        if pet is None:
+            return self.send_text(500, 'Internal Server Error')
+        self.send_json(200, pet)
+
+    def update_pet(self, pet_id: str):
+        owner = self.authorize()
+        if owner is None:
+            return
+        fields = {name: value for name, value in self.form().items() if name in ('name', 'animal_type', 'age')}
+        pet = self.server.store.update_pet(owner, pet_id, **fields)
+        if pet is None:
+            return self.send_text(400, 'Bad Request')
+        self.send_json(200, pet)
+
+    def delete_pet(self, pet_id: str):
+        owner = self.authorize()
+        if owner is None:
+            return
+        self.server.store.delete_pet(owner, pet_id)
+        # Как и настоящий сервер, в ответ на удаление приходит пустое тело
+        self.send_body(200, b'', 'text/html; charset=utf-8')
+
+
+class FakePetFriendsServer:
+    """Сервер Pet Friends в отдельном потоке текущего процесса.
+
+    users - словарь email: пароль (по умолчанию пользователь из settings.py);
+    profiles - словарь 'эндпоинт': Profile, эндпоинты: key, pets, pet, create_pet_simple,
+    set_photo; default_profile - Profile для остальных эндпоинтов;
+    seed_pets - сколько питомцев другого пользователя создать при старте;
+    own_pets - сколько питомцев создать каждому пользователю из users"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, users: dict = None,
+                 profiles: dict = None, default_profile: Profile = None, seed_pets: int = 5,
+                 own_pets: int = 3):
+        self.store = PetStore(users or {valid_email: valid_password})
+        for i in range(seed_pets):
+            self.store.add_pet('seed@petfriends.local', f'Питомец{i}', 'кот', str(i % 10 + 1))
+        for email in self.store.users:
+            for i in range(own_pets):
+                self.store.add_pet(email, f'Мой{i}', 'кот', str(i % 10 + 1))
+
+        self.httpd = ThreadingHTTPServer((host, port), PetFriendsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.store = self.store
+        self.httpd.profiles = profiles or {}
+        self.httpd.default_profile = default_profile or Profile()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> 'FakePetFriendsServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Локальный сервер Pet Friends")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа в секундах")
+    parser.add_argument('--jitter', type=float, default=0.0, help="разброс задержки в секундах")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов с ошибкой 500")
+    args = parser.parse_args(argv)
+
+    server = FakePetFriendsServer(args.host, args.port,
+                                  default_profile=Profile(args.latency, args.jitter, args.error_rate))
+    print(f"Pet Friends слушает {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Замеры времени запросов PetFriends: DNS, подключение, TLS, ожидание ответа сервера и
+скачивание тела, а также размеры запроса и ответа. Каждый замер (RequestTiming) передаётся
+в хуки, заданные в PetFriends(metrics_hooks=[...]). Хуком может быть любая функция от
+RequestTiming, готовые хуки - LatencyHistogram и JsonLinesExporter"""
+import bisect
+import json
+import re
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+PHASES = ('dns', 'connect', 'tls', 'server', 'download', 'total')
+
+# Замер текущего запроса; соединение в каждый момент используется только одним потоком
+_local = threading.local()
+
+
+def endpoint_of(method: str, path: str) -> str:
+    """Название эндпоинта без id питомца, например 'PUT api/pets/{id}'"""
+
+    path = re.sub('/+', '/', path).strip('/')
+    path = re.sub(r'^(api/pets/(?:set_photo/)?)[^/]+$', r'\1{id}', path)
+    return f"{method} {path}"
+
+
+class RequestTiming:
+    """Замер одного запроса. Все времена в секундах; dns, connect и tls равны нулю, если
+    запрос ушёл по уже открытому соединению из пула"""
+
+    __slots__ = ('method', 'endpoint', 'status', 'error', 'started', 'request_bytes', 'response_bytes',
+                 'dns', 'connect', 'tls', 'server', 'download', 'total')
+
+    def __init__(self, method: str, endpoint: str):
+        self.method = method
+        self.endpoint = endpoint
+        self.status = None
+        self.error = None
+        self.started = time.time()
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.dns = 0.0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.server = 0.0
+        self.download = 0.0
+        self.total = 0.0
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _current() -> RequestTiming:
+    return getattr(_local, 'timing', None)
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """Соединение, которое записывает время DNS и TCP подключения в текущий RequestTiming"""
+
+    def _new_conn(self) -> socket.socket:
+        timing = _current()
+        if timing is None:
+            return super()._new_conn()
+
+        start = time.perf_counter()
+        try:
+            records = socket.getaddrinfo(self._dns_host.strip('[]'), self.port, allowed_gai_family(),
+                                         socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            # Ошибку разрешения имени сформирует сам urllib3
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        timing.dns += resolved - start
+        addresses = list(dict.fromkeys(record[4][0] for record in records))
+
+        # Как и urllib3, перебираем все найденные адреса, пока к одному не подключимся (например,
+        # если IPv6 адрес недоступен), но без повторного DNS запроса: хост уже задан адресом
+        dns_host = self._dns_host
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (ConnectTimeoutError, NewConnectionError):
+                    if i == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = dns_host
+            timing.connect += time.perf_counter() - resolved
+        # getaddrinfo не вернул ни одного адреса
+        return super()._new_conn()
+
+
+class TimedHTTPSConnection(TimedHTTPConnection, HTTPSConnection):
+    """То же для HTTPS: время TLS рукопожатия - это время connect() без DNS и TCP подключения"""
+
+    def connect(self):
+        timing = _current()
+        if timing is None:
+            return super().connect()
+
+        before = timing.dns + timing.connect
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            timing.tls += time.perf_counter() - start - (timing.dns + timing.connect - before)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter с замером соединений. Время server - от начала отправки запроса до получения
+    заголовков ответа за вычетом DNS, подключения и TLS"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, *args, **kwargs):
+        timing = _current()
+        start = time.perf_counter()
+        try:
+            return super().send(request, *args, **kwargs)
+        finally:
+            if timing is not None:
+                timing.server = time.perf_counter() - start - timing.dns - timing.connect - timing.tls
+                timing.request_bytes = int(request.headers.get('Content-Length') or 0)
+
+
+def timed_request(session, hooks: list, method: str, url: str, **kwargs):
+    """Выполняет session.request, замеряя его, и передаёт RequestTiming во все хуки"""
+
+    timing = RequestTiming(method, endpoint_of(method, urlsplit(url).path))
+    _local.timing = timing
+    start = time.perf_counter()
+    try:
+        res = session.request(method, url, **kwargs)
+    except Exception as e:
+        timing.error = repr(e)
+        raise
+    else:
+        timing.status = res.status_code
+        if not kwargs.get('stream'):
+            timing.response_bytes = len(res.content)
+        else:
+            timing.response_bytes = int(res.headers.get('Content-Length') or 0)
+        return res
+    finally:
+        _local.timing = None
+        timing.total = time.perf_counter() - start
+        # Без stream=True тело уже прочитано requests, это время и есть скачивание
+        timing.download = max(timing.total - timing.dns - timing.connect - timing.tls - timing.server, 0.0)
+        for hook in hooks:
+            hook(timing)
+
+
+class LatencyHistogram:
+    """Хук, собирающий гистограммы времени по эндпоинтам и фазам запроса в памяти, а также
+    количество запросов, ошибок и переданных байт. Экспортируется в текстовом формате Prometheus"""
+
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.histograms = {}
+        self.requests = {}
+        self.bytes = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, timing: RequestTiming):
+        with self._lock:
+            for phase in PHASES:
+                value = getattr(timing, phase)
+                histogram = self.histograms.setdefault((timing.endpoint, phase),
+                                                       {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0})
+                histogram['counts'][bisect.bisect_left(self.buckets, value)] += 1
+                histogram['sum'] += value
+            status = str(timing.status) if timing.status is not None else 'error'
+            key = (timing.endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            sent, received = self.bytes.get(timing.endpoint, (0, 0))
+            self.bytes[timing.endpoint] = (sent + timing.request_bytes, received + timing.response_bytes)
+
+    def to_prometheus(self) -> str:
+        lines = ['# TYPE petfriends_request_duration_seconds histogram']
+        with self._lock:
+            for (endpoint, phase), histogram in sorted(self.histograms.items()):
+                labels = f'endpoint="{endpoint}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), histogram['counts']):
+                    cumulative += count
+                    lines.append(f'petfriends_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'petfriends_request_duration_seconds_sum{{{labels}}} {histogram["sum"]}')
+                lines.append(f'petfriends_request_duration_seconds_count{{{labels}}} {cumulative}')
+            lines.append('# TYPE petfriends_requests_total counter')
+            for (endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'petfriends_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+            for name, index in (('petfriends_request_bytes_total', 0), ('petfriends_response_bytes_total', 1)):
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, sizes in sorted(self.bytes.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {sizes[index]}')
+        return '\n'.join(lines) + '\n'
+
+
+class JsonLinesExporter:
+    """Хук, записывающий каждый замер отдельной JSON строкой в файл"""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, timing: RequestTiming):
+        line = json.dumps(timing.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,297 @@
+"""Компактное представление питомцев. Pet хранит поля в __slots__ вместо словаря, повторяющиеся
+строки (animal_type, user_id, age) интернируются, а JSON разбирается через orjson, если он
+установлен. Для сравнения памяти и скорости с обычными словарями: python models.py"""
+import bisect
+import functools
+import json
+import sys
+import threading
+from operator import itemgetter
+
+
+@functools.cache
+def _orjson():
+    """Модуль orjson или None, если он не установлен. Импортируется при первом разборе JSON"""
+
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+def loads(data):
+    """Разбирает JSON из bytes или str, через orjson, если он установлен"""
+
+    orjson = _orjson()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Pet:
+    """Питомец. Поля доступны как атрибутами (pet.name), так и по ключу (pet['name']),
+    поэтому Pet можно использовать вместо словаря из ответа сервера"""
+
+    FIELDS = ('id', 'name', 'animal_type', 'age', 'pet_photo', 'user_id', 'created_at')
+    FIELD_SET = frozenset(FIELDS)
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, id: str, name: str = '', animal_type: str = '', age: str = '',
+                 pet_photo: str = '', user_id: str = '', created_at: str = '', extra: dict = None):
+        self.id = id
+        self.name = name
+        self.animal_type = sys.intern(animal_type) if isinstance(animal_type, str) else animal_type
+        self.age = sys.intern(age) if isinstance(age, str) else age
+        self.pet_photo = pet_photo
+        self.user_id = sys.intern(user_id) if isinstance(user_id, str) else user_id
+        self.created_at = created_at
+        # Поля, которых нет в FIELDS, если сервер их прислал
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Pet':
+        extra = {key: value for key, value in data.items() if key not in cls.FIELD_SET} or None
+        return cls(data.get('id'), data.get('name', ''), data.get('animal_type', ''), data.get('age', ''),
+                   data.get('pet_photo', ''), data.get('user_id', ''), data.get('created_at', ''), extra)
+
+    def to_dict(self) -> dict:
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __getitem__(self, key: str):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS or bool(self.extra) and key in self.extra
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Pet):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Pet(id={self.id!r}, name={self.name!r}, animal_type={self.animal_type!r}, age={self.age!r})"
+
+
+class PetList:
+    """Список питомцев из ответа get_list_of_pets.
+
+    from_json не создаёт Pet сразу: список хранит словари, которые вернул orjson, и превращает
+    словарь в Pet при первом обращении к нему (по индексу или при итерации), поэтому разбор
+    ответа стоит столько же, сколько orjson.loads. compact() превращает в Pet все словари сразу:
+    список, который нужно долго хранить, занимает после этого вдвое меньше памяти"""
+
+    __slots__ = ('_items',)
+
+    def __init__(self, pets: list):
+        # Элементы - Pet или ещё не преобразованные словари из ответа сервера
+        self._items = pets
+
+    @classmethod
+    def from_json(cls, data) -> 'PetList':
+        """Разбирает ответ сервера вида {"pets": [...]} из bytes или str"""
+
+        return cls(loads(data)['pets'])
+
+    @classmethod
+    def from_dicts(cls, items) -> 'PetList':
+        """Собирает PetList из словарей, сразу превращая их в Pet"""
+
+        return cls(list(items)).compact()
+
+    def _pet(self, position: int) -> Pet:
+        pet = self._items[position]
+        if not isinstance(pet, Pet):
+            # Из разных потоков словарь может быть преобразован дважды, результаты равны
+            pet = self._items[position] = Pet.from_dict(pet)
+        return pet
+
+    def compact(self) -> 'PetList':
+        """Превращает в Pet все словари, к которым ещё не обращались, и возвращает сам список.
+        Быстрый путь без вызова Pet.__init__ для питомцев, у которых нет неизвестных полей;
+        одинаковые значения повторяющихся полей хранятся одной строкой"""
+
+        new = object.__new__
+        known = Pet.FIELD_SET
+        shared = {}.setdefault
+        items = self._items
+        for position, item in enumerate(items):
+            if isinstance(item, Pet):
+                continue
+            if not item.keys() <= known:
+                items[position] = Pet.from_dict(item)
+                continue
+            get = item.get
+            pet = new(Pet)
+            pet.id = get('id')
+            pet.name = get('name', '')
+            value = get('animal_type', '')
+            pet.animal_type = shared(value, value)
+            value = get('age', '')
+            pet.age = shared(value, value)
+            value = get('pet_photo', '')
+            pet.pet_photo = shared(value, value) if not value else value
+            value = get('user_id', '')
+            pet.user_id = shared(value, value)
+            pet.created_at = get('created_at', '')
+            pet.extra = None
+            items[position] = pet
+        return self
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        for position in range(len(self._items)):
+            yield self._pet(position)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._pet(position) for position in range(*index.indices(len(self._items)))]
+        return self._pet(index)
+
+    @property
+    def pets(self) -> list:
+        """Список Pet (все словари при этом преобразуются)"""
+
+        return self.compact()._items
+
+    def ids(self) -> list:
+        # id читается и из Pet, и из словаря, не создавая Pet
+        return [pet['id'] for pet in self._items]
+
+    def to_dict(self) -> dict:
+        return {'pets': [pet.to_dict() if isinstance(pet, Pet) else dict(pet) for pet in self._items]}
+
+
+class PetIndex:
+    """Индексы по списку питомцев: поиск по id за O(1), по name и animal_type через хэш-таблицы
+    и выборка по диапазону возраста через отсортированный список. Питомцы могут быть словарями
+    из ответа сервера или Pet. Индекс можно обновлять результатами add_new_pet, update_pet_info
+    и delete_pet, не запрашивая список заново. Индекс можно менять и читать из нескольких потоков
+    (пакетные методы PetFriends обновляют его из своего пула)"""
+
+    def __init__(self, pets=()):
+        # add вызывает remove, поэтому блокировка повторно входимая
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_name = {}
+        self._by_animal_type = {}
+        # Отсортированные пары (возраст, id) для питомцев с числовым возрастом
+        self._ages = []
+        for pet in pets:
+            self.add(pet)
+
+    @classmethod
+    def from_response(cls, result) -> 'PetIndex':
+        """Строит индекс по результату get_list_of_pets: словарю {'pets': [...]} или PetList"""
+
+        return cls(result['pets'] if isinstance(result, dict) else result)
+
+    @staticmethod
+    def _age(pet):
+        try:
+            return float(pet['age'])
+        except (TypeError, ValueError):
+            return None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._by_id.values()))
+
+    def __contains__(self, pet_id: str) -> bool:
+        return pet_id in self._by_id
+
+    def get(self, pet_id: str):
+        return self._by_id.get(pet_id)
+
+    def add(self, pet):
+        """Добавляет питомца или заменяет уже проиндексированного с тем же id"""
+
+        pet_id = pet['id']
+        age = self._age(pet)
+        with self._lock:
+            self.remove(pet_id)
+            self._by_id[pet_id] = pet
+            self._by_name.setdefault(pet['name'], {})[pet_id] = pet
+            self._by_animal_type.setdefault(pet['animal_type'], {})[pet_id] = pet
+            if age is not None:
+                bisect.insort(self._ages, (age, pet_id))
+
+    def remove(self, pet_id: str):
+        """Убирает питомца из индекса, если он там есть"""
+
+        with self._lock:
+            pet = self._by_id.pop(pet_id, None)
+            if pet is None:
+                return
+            for index, key in ((self._by_name, pet['name']), (self._by_animal_type, pet['animal_type'])):
+                bucket = index[key]
+                del bucket[pet_id]
+                if not bucket:
+                    del index[key]
+            age = self._age(pet)
+            if age is not None:
+                position = bisect.bisect_left(self._ages, (age, pet_id))
+                del self._ages[position]
+
+    def by_name(self, name: str) -> list:
+        with self._lock:
+            return list(self._by_name.get(name, {}).values())
+
+    def by_animal_type(self, animal_type: str) -> list:
+        with self._lock:
+            return list(self._by_animal_type.get(animal_type, {}).values())
+
+    def by_age(self, min_age: float = None, max_age: float = None) -> list:
+        """Питомцы с min_age <= возраст <= max_age в порядке возрастания возраста"""
+
+        with self._lock:
+            start = 0 if min_age is None else bisect.bisect_left(self._ages, min_age, key=itemgetter(0))
+            stop = len(self._ages) if max_age is None else bisect.bisect_right(self._ages, max_age, key=itemgetter(0))
+            return [self._by_id[pet_id] for _, pet_id in self._ages[start:stop]]
+
+
+def _measure(count: int = 100_000):
+    """Сравнивает разбор count питомцев в словари (json) и в PetList: лучшее время из пяти
+    запусков и память, занятую результатом"""
+
+    import timeit
+    import tracemalloc
+
+    body = json.dumps({'pets': [{
+        'id': f'{i:024x}', 'name': f'Питомец{i}', 'animal_type': ('кот', 'пёс', 'сова')[i % 3],
+        'age': str(i % 15), 'pet_photo': '', 'user_id': f'user{i % 50}', 'created_at': f'{1700000000 + i}.0',
+    } for i in range(count)]}).encode()
+
+    parsers = (('json.loads -> dict', json.loads), ('PetList.from_json', PetList.from_json),
+               ('from_json().compact()', lambda body: PetList.from_json(body).compact()))
+    for title, parse in parsers:
+        elapsed = min(timeit.repeat(lambda: parse(body), number=1, repeat=5))
+
+        tracemalloc.start()
+        result = parse(body)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        print(f"{title:<24} {elapsed * 1000:8.1f} ms {memory / 1024 / 1024:8.1f} MiB")
+
+
+if __name__ == '__main__':
+    _measure()
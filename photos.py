@@ -0,0 +1,220 @@
+import hashlib
+import io
+import logging
+import mmap
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class PetPhoto:
+    """Фото питомца для загрузки на сервер. Файл отображается в память (mmap) и не копируется,
+    байтовые буферы (bytes, bytearray, memoryview) используются как есть. Один PetPhoto можно
+    передавать в add_new_pet и post_new_photo_of_pet сколько угодно раз"""
+
+    def __init__(self, source, filename: str = None, content_type: str = 'image/jpeg'):
+        self.content_type = content_type
+        self._mmap = None
+        if isinstance(source, (str, os.PathLike)):
+            self.filename = filename or os.fspath(source)
+            # После mmap файловый дескриптор больше не нужен и сразу закрывается
+            with open(source, 'rb') as file:
+                if os.fstat(file.fileno()).st_size > 0:
+                    self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self._mmap) if self._mmap is not None else memoryview(b'')
+        else:
+            self.filename = filename or 'pet_photo.jpg'
+            self.data = memoryview(source).cast('B')
+
+    def __len__(self):
+        return self.data.nbytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Освобождает буфер и закрывает отображение файла в память"""
+
+        self.data.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+class MultipartStream:
+    """Тело запроса multipart/form-data, которое отдаётся по частям без склейки в один буфер:
+    данные фото отправляются кусками memoryview прямо из PetPhoto"""
+
+    def __init__(self, fields: dict, blocksize: int = 64 * 1024):
+        """fields - словарь 'имя поля': значение, где значение - строка либо PetPhoto"""
+
+        self.fields = fields
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.blocksize = blocksize
+
+        self._parts = []
+        for name, value in fields.items():
+            if isinstance(value, PetPhoto):
+                filename = value.filename.replace('"', '%22')
+                header = (f'--{self.boundary}\r\n'
+                          f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                          f'Content-Type: {value.content_type}\r\n\r\n')
+                self._parts += [header.encode(), value.data, b'\r\n']
+            else:
+                header = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                self._parts += [header.encode(), str(value).encode(), b'\r\n']
+        self._parts.append(f'--{self.boundary}--\r\n'.encode())
+
+        self.len = sum(len(memoryview(part)) for part in self._parts)
+        self._index = 0
+        self._offset = 0
+
+    def __len__(self):
+        return self.len
+
+    def rewind(self):
+        """Возвращает чтение к началу тела, чтобы отправить запрос ещё раз"""
+
+        self._index = 0
+        self._offset = 0
+
+    def read(self, size: int = -1) -> memoryview:
+        """Возвращает следующий кусок тела не длиннее size (или blocksize), не копируя данные"""
+
+        if size is None or size < 0:
+            size = self.blocksize
+        while self._index < len(self._parts):
+            part = memoryview(self._parts[self._index])
+            if self._offset < len(part):
+                chunk = part[self._offset:self._offset + size]
+                self._offset += len(chunk)
+                return chunk
+            self._index += 1
+            self._offset = 0
+        return memoryview(b'')
+
+
+def _encode_photo(data: bytes, max_side: int, quality: int) -> tuple:
+    """Уменьшает изображение так, чтобы большая сторона была не больше max_side, и сжимает в JPEG.
+    Возвращает (байты, True) или (исходные байты, False), если пережатое фото не меньше исходного.
+    Выполняется в отдельном процессе, поэтому функция находится на уровне модуля"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        resized = max(image.size) > max_side
+        if resized:
+            image.thumbnail((max_side, max_side))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=quality, optimize=True)
+    encoded = output.getvalue()
+    if resized or len(encoded) < len(data):
+        return encoded, True
+    return data, False
+
+
+class PhotoPreprocessor:
+    """Подготовка фото перед загрузкой для PetFriends(photo_preprocessor=...): фото уменьшается до
+    max_side пикселей по большей стороне и пережимается в JPEG в пуле процессов. Результат
+    запоминается по sha256 исходных байт, поэтому одно и то же фото обрабатывается один раз, а
+    повторные загрузки берут готовые байты из кэша (LRU не больше max_entries фото и max_bytes байт).
+    Нужна библиотека Pillow (pip install Pillow). Процессы пула запускаются через forkserver или
+    spawn, поэтому код скрипта, который использует PhotoPreprocessor, должен стоять под
+    if __name__ == '__main__'"""
+
+    def __init__(self, max_side: int = 1280, quality: int = 85, max_workers: int = None,
+                 max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        try:
+            import PIL.Image
+        except ImportError:
+            raise ImportError("Для PhotoPreprocessor нужна библиотека Pillow (pip install Pillow)") from None
+        self.max_side = max_side
+        self.quality = quality
+        self.max_workers = max_workers
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Останавливает пул процессов"""
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _create_executor(self):
+        """Пул процессов часто создаётся из потока пакетных методов PetFriends, а fork процесса,
+        в котором другие потоки держат блокировки, может повесить дочерний процесс. Поэтому
+        процессы запускаются через forkserver (на Windows его нет - через spawn)"""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(method))
+
+    def prepare(self, photo: PetPhoto) -> PetPhoto:
+        """Возвращает новый PetPhoto с подготовленными байтами. Исходный photo не закрывается"""
+
+        key = hashlib.sha256(photo.data).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                # Одно и то же фото, пришедшее из нескольких потоков сразу, обрабатывается один раз
+                future = self._pending.get(key)
+                if future is None:
+                    if self._executor is None:
+                        self._executor = self._create_executor()
+                    future = self._executor.submit(_encode_photo, bytes(photo.data), self.max_side, self.quality)
+                    self._pending[key] = future
+
+        if entry is None:
+            try:
+                entry = future.result()
+            except Exception as e:
+                logger.warning(f"Не удалось обработать фото {photo.filename}, загружается исходное: {e}")
+                entry = bytes(photo.data), False
+            self._store(key, entry)
+
+        data, encoded = entry
+        if not encoded:
+            return PetPhoto(data, photo.filename, photo.content_type)
+        filename = os.path.splitext(os.path.basename(photo.filename))[0] + '.jpg'
+        return PetPhoto(data, filename, 'image/jpeg')
+
+    def _store(self, key: str, entry: tuple):
+        with self._lock:
+            self._pending.pop(key, None)
+            if key in self._entries or len(entry[0]) > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += len(entry[0])
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (data, _) = self._entries.popitem(last=False)
+                self.size -= len(data)
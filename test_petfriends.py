@@ -1,10 +1,98 @@
-from api import PetFriends
+from api import PetFriends, ResponseCache
+from benchmark import Benchmark, import_time, parse_mix, percentile
+from cassette import Cassette, CassetteMiss
+from fake_server import FakePetFriendsServer, Profile
+from metrics import LatencyHistogram
+from models import Pet, PetIndex, PetList
+from photos import PetPhoto, PhotoPreprocessor
 from settings import valid_email, valid_password
+from throttle import CircuitBreaker, Throttle, TokenBucket
+from workflow import Workflow
+import asyncio
+import base64
+import io
+import itertools
 import os
 import random
+import socket
+import sys
+import time
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 
-pf = PetFriends()
+# По умолчанию тесты гоняются против локального fake_server. Чтобы проверить настоящий сервер,
+# задайте его адрес: PETFRIENDS_BASE_URL=https://petfriends.skillfactory.ru/ pytest
+# PETFRIENDS_FAKE_LATENCY добавляет локальному серверу задержку ответа в секундах
+base_url = os.environ.get('PETFRIENDS_BASE_URL')
+if base_url is None:
+    server = FakePetFriendsServer(
+        default_profile=Profile(latency=float(os.environ.get('PETFRIENDS_FAKE_LATENCY', 0)))).start()
+    base_url = server.base_url
+
+# PETFRIENDS_CASSETTE=путь записывает запросы pf в кассету или воспроизводит их из неё,
+# режим задаёт PETFRIENDS_CASSETTE_MODE (record, replay, auto - по умолчанию), см. cassette.py.
+# Кассета воспроизводит запросы по порядку, поэтому записывать и воспроизводить её нужно без -n
+cassette = None
+if os.environ.get('PETFRIENDS_CASSETTE'):
+    cassette = Cassette(os.environ['PETFRIENDS_CASSETTE'], os.environ.get('PETFRIENDS_CASSETTE_MODE', 'auto'))
+
+pf = PetFriends(base_url, cassette=cassette)
+
+# Тесты можно запускать параллельно (pytest -n 4, плагин pytest-xdist) на одном аккаунте.
+# Каждый тест работает только со своими питомцами, а имена питомцев из фикстур помечены тегом
+# процесса, чтобы в конце сессии подчистить всё, что этот процесс создал. С кассетой тег
+# постоянный, иначе тела запросов при воспроизведении не совпали бы с записанными
+WORKER_TAG = f"{os.environ.get('PYTEST_XDIST_WORKER', 'main')}-{'cassette' if cassette is not None else uuid.uuid4().hex[:6]}"
+
+
+@pytest.fixture(scope='session')
+def auth_key():
+    _, key = pf.get_api_key(valid_email, valid_password)
+    return key
+
+
+@pytest.fixture(scope='session', autouse=True)
+def sweep_tagged_pets(auth_key):
+    """После всех тестов процесса удаляет его помеченных питомцев, если кто-то остался"""
+
+    yield
+    tagged = [pet['id'] for pet in pf.iter_pets(auth_key, "my_pets") if pet['name'].startswith(WORKER_TAG)]
+    pf.delete_pets(auth_key, tagged).wait()
+
+
+@pytest.fixture
+def created_pets(auth_key):
+    """Список id питомцев, созданных тестом: после теста они удаляются одним пакетом,
+    даже если тест упал"""
+
+    pet_ids = []
+    yield pet_ids
+    pf.delete_pets(auth_key, pet_ids).wait()
+
+
+@pytest.fixture
+def body_matching_pf():
+    """pf для запросов, которые отличаются только телом (например, одновременные
+    add_new_pet_no_photo разных питомцев): с кассетой они сопоставляются и по телу, иначе
+    при воспроизведении параллельные запросы получили бы ответы друг друга"""
+
+    if cassette is None:
+        yield pf
+        return
+    with Cassette(cassette.path + '.body', cassette.mode, match=cassette.match + ('body',)) as body_cassette:
+        with PetFriends(base_url, cassette=body_cassette) as matching_pf:
+            yield matching_pf
+
+
+@pytest.fixture
+def my_pet(auth_key, created_pets):
+    """Собственный питомец теста, которого не трогают тесты в других процессах"""
+
+    _, pet = pf.add_new_pet_no_photo(auth_key, f"{WORKER_TAG}-питомец", 'кот', '3')
+    created_pets.append(pet['id'])
+    return pet
 
 
 def test_get_api_key_for_valid_user(email=valid_email, password=valid_password):
@@ -18,6 +106,63 @@ def test_get_api_key_for_valid_user(email=valid_email, password=valid_password):
     assert 'key' in result
 
 
+def test_get_api_key_is_cached(email=valid_email, password=valid_password):
+    """Проверяем, что повторный запрос ключа с теми же данными берётся из кэша PetFriends"""
+
+    status, first = pf.get_api_key(email, password)
+    _, second = pf.get_api_key(email, password)
+
+    assert status == 200
+    assert second is first
+
+
+def test_get_api_key_single_flight_and_persistence(tmp_path, threads=8):
+    """Проверяем, что одновременные запросы ключа из нескольких потоков ждут один общий запрос
+    к серверу, а ключ из key_cache_file используется новым PetFriends без запроса к серверу"""
+
+    key_cache_file = str(tmp_path / 'keys.json')
+    key_requests = []
+    hooks = [lambda timing: key_requests.append(timing) if timing.endpoint == 'GET api/key' else None]
+    with FakePetFriendsServer(profiles={'key': Profile(latency=0.05)}) as key_server:
+        with PetFriends(key_server.base_url, key_cache_file=key_cache_file, metrics_hooks=hooks) as first_pf:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = list(executor.map(lambda _: first_pf.get_api_key(valid_email, valid_password),
+                                            range(threads)))
+        assert len(key_requests) == 1
+        assert all(status == 200 and result is results[0][1] for status, result in results)
+
+        with PetFriends(key_server.base_url, key_cache_file=key_cache_file, metrics_hooks=hooks) as second_pf:
+            status, result = second_pf.get_api_key(valid_email, valid_password)
+        assert len(key_requests) == 1
+        assert status == 200 and result['key'] == results[0][1]['key']
+
+
+def test_expired_key_is_refreshed_for_every_method(pet_photo='images/owl.jpg'):
+    """Проверяем, что после того, как сервер забыл ключ, каждый метод перелогинивается и повторяет
+    запрос, в том числе методы с потоковым multipart телом"""
+
+    pet_photo = os.path.join(os.path.dirname(__file__), pet_photo)
+    with FakePetFriendsServer() as key_server, PetFriends(key_server.base_url) as expiring_pf:
+        _, auth_key = expiring_pf.get_api_key(valid_email, valid_password)
+        calls = [
+            lambda: expiring_pf.get_list_of_pets(auth_key, "my_pets"),
+            lambda: expiring_pf.add_new_pet(auth_key, 'Ключ', 'кот', '1', pet_photo),
+            lambda: expiring_pf.add_new_pet_no_photo(auth_key, 'Ключ', 'кот', '1'),
+        ]
+        statuses = []
+        for call in calls:
+            key_server.store.keys.clear()
+            statuses.append(call()[0])
+        _, pet = expiring_pf.add_new_pet_no_photo(auth_key, 'Ключ', 'кот', '1')
+        for call in (lambda: expiring_pf.post_new_photo_of_pet(auth_key, pet['id'], pet_photo),
+                     lambda: expiring_pf.update_pet_info(auth_key, pet['id'], 'Ключ2', 'кот', 2),
+                     lambda: expiring_pf.delete_pet(auth_key, pet['id'])):
+            key_server.store.keys.clear()
+            statuses.append(call()[0])
+
+    assert statuses == [200] * 6
+
+
 def test_get_all_pets_with_valid_key(filter=''):
     """ Проверяем что запрос всех питомцев возвращает не пустой список.
     Для этого сначала получаем api ключ и сохраняем в переменную auth_key. Далее используя этого ключ
@@ -31,7 +176,21 @@ def test_get_all_pets_with_valid_key(filter=''):
     assert len(result['pets']) > 0
 
 
-def test_add_new_pet_with_valid_data(name='Барин', animal_type='пук',
+def test_iter_pets_streams_same_pets(my_pet, filter=''):
+    """Проверяем, что потоковый iter_pets отдаёт тех же питомцев, что и get_list_of_pets,
+    и что итерацию можно прервать досрочно"""
+
+    _, auth_key = pf.get_api_key(valid_email, valid_password)
+
+    streamed = {pet['id']: pet for pet in pf.iter_pets(auth_key, "my_pets")}
+    assert streamed[my_pet['id']]['name'] == my_pet['name']
+
+    first_pets = list(itertools.islice(pf.iter_pets(auth_key, filter), 3))
+    assert len(first_pets) == 3
+    assert all('id' in pet for pet in first_pets)
+
+
+def test_add_new_pet_with_valid_data(created_pets, name='Барин', animal_type='пук',
                                      age='4', pet_photo='images/owl.jpg'):
     """Проверяем что можно добавить питомца с корректными данными"""
 
@@ -43,30 +202,20 @@ def test_add_new_pet_with_valid_data(name='Барин', animal_type='пук',
 
     # Добавляем питомца
     status, result = pf.add_new_pet(auth_key, name, animal_type, age, pet_photo)
+    # Очистка: добавленный питомец удалится после теста
+    created_pets.append(result['id'])
 
     # Сверяем полученный ответ с ожидаемым результатом
     assert status == 200
     assert result['name'] == name
 
-    # Очистка: удаляем добавленного питомца
-    pet_id = result['id']
-    pf.delete_pet(auth_key, pet_id)
-
 
-def test_successful_delete_self_pet():
+def test_successful_delete_self_pet(my_pet):
     """Проверяем возможность удаления питомца"""
 
-    # Получаем ключ auth_key и запрашиваем список своих питомцев
+    # Получаем ключ auth_key; удаляем питомца, созданного фикстурой для этого теста
     _, auth_key = pf.get_api_key(valid_email, valid_password)
-    _, my_pets = pf.get_list_of_pets(auth_key, "my_pets")
-
-    # Проверяем - если список своих питомцев пустой, то добавляем нового и опять запрашиваем список своих питомцев
-    if len(my_pets['pets']) == 0:
-        pf.add_new_pet(auth_key, "Супер", "кот", "3", "images/owl.jpg")
-        _, my_pets = pf.get_list_of_pets(auth_key, "my_pets")
-
-    # Берём id первого питомца из списка и отправляем запрос на удаление
-    pet_id = my_pets['pets'][0]['id']
+    pet_id = my_pet['id']
     status, _ = pf.delete_pet(auth_key, pet_id)
 
     # Ещё раз запрашиваем список своих питомцев
@@ -74,41 +223,32 @@ def test_successful_delete_self_pet():
 
     # Проверяем что статус ответа равен 200 и в списке питомцев нет id удалённого питомца
     assert status == 200
-    assert pet_id not in my_pets.values()
+    assert pet_id not in [pet['id'] for pet in my_pets['pets']]
 
 
-def test_successful_update_self_pet_info(name='Мур', animal_type='Котэ', age=5):
+def test_successful_update_self_pet_info(my_pet, name='Мур', animal_type='Котэ', age=5):
     """Проверяем возможность обновления информации о питомце"""
 
-    # Получаем ключ auth_key и список своих питомцев
+    # Получаем ключ auth_key и обновляем имя, тип и возраст питомца, созданного для этого теста
     _, auth_key = pf.get_api_key(valid_email, valid_password)
-    _, my_pets = pf.get_list_of_pets(auth_key, "my_pets")
+    status, result = pf.update_pet_info(auth_key, my_pet['id'], name, animal_type, age)
 
-    # Если список не пустой, то пробуем обновить его имя, тип и возраст
-    if len(my_pets['pets']) > 0:
-        status, result = pf.update_pet_info(auth_key, my_pets['pets'][0]['id'], name, animal_type, age)
-
-        # Проверяем что статус ответа = 200 и имя питомца соответствует заданному
-        assert status == 200
-        assert result['name'] == name
-    else:
-        # если список питомцев пустой, то выкидываем исключение с текстом об отсутствии своих питомцев
-        raise Exception("There is no my pets")
+    # Проверяем что статус ответа = 200 и имя питомца соответствует заданному
+    assert status == 200
+    assert result['name'] == name
 
 
     # Начало практической работы
-def test_add_new_pet_no_photo_valid_data(name='КРОНА', animal_type='ПИТ', age='555'):
+def test_add_new_pet_no_photo_valid_data(created_pets, name='КРОНА', animal_type='ПИТ', age='555'):
     """Проверяем, что можно добавить питомца с корректными данными без фото"""
 
     # Запрашиваем ключ api и сохраняем в переменную auth_key
     _, auth_key = pf.get_api_key(valid_email, valid_password)
     _, my_pets = pf.get_list_of_pets(auth_key, "my_pets")
 
-    # Сохраняем количество питомцев до добавления
-    initial_pet_count = len(my_pets['pets']) if 'pets' in my_pets else 0
-
-    # Добавляем питомца
+    # Добавляем питомца; очистка: он удалится после теста
     status, result = pf.add_new_pet_no_photo(auth_key, name, animal_type, age)
+    created_pets.append(result['id'])
 
     # Сверяем полученный ответ с ожидаемым результатом
     assert status == 200
@@ -116,16 +256,14 @@ def test_add_new_pet_no_photo_valid_data(name='КРОНА', animal_type='ПИТ'
     assert result['animal_type'] == animal_type
     assert result['age'] == age
 
-    # Проверяем, что количество питомцев увеличилось на 1
+    # Проверяем, что питомца не было в списке до добавления и он появился после.
+    # Количество питомцев не сравниваем: параллельные тесты меняют его на том же аккаунте
     _, my_pets_after = pf.get_list_of_pets(auth_key, "my_pets")
-    assert len(my_pets_after['pets']) == initial_pet_count + 1
-
-    # Очистка: удаляем добавленного питомца
-    pet_id = result['id']
-    pf.delete_pet(auth_key, pet_id)
+    assert result['id'] not in [pet['id'] for pet in my_pets['pets']]
+    assert result['id'] in [pet['id'] for pet in my_pets_after['pets']]
 
 
-def test_post_new_photo_of_pet_valid_data(pet_photo='images/try.jpg'):
+def test_post_new_photo_of_pet_valid_data(my_pet, pet_photo='images/try.jpg'):
     """Проверяем, что можно добавить фото питомца с корректными данными"""
 
     # Получаем полный путь изображения питомца и сохраняем в переменную pet_photo
@@ -138,11 +276,8 @@ def test_post_new_photo_of_pet_valid_data(pet_photo='images/try.jpg'):
     # Запрашиваем ключ API и сохраняем в переменную auth_key
     _, auth_key = pf.get_api_key(valid_email, valid_password)
 
-    # Получаем список питомцев и берем id первого питомца
-    _, my_pets = pf.get_list_of_pets(auth_key, "my_pets")
-    if not my_pets['pets']:
-        raise ValueError("Список питомцев пуст.")
-    pet_id = my_pets['pets'][0]['id']
+    # Берём id питомца, созданного для этого теста
+    pet_id = my_pet['id']
 
     # Отправляем запрос на добавление фото
     status, result = pf.post_new_photo_of_pet(auth_key, pet_id, pet_photo)
@@ -178,7 +313,7 @@ def test_get_api_key_for_invalid_email_pass(email="", password=""):
     print(result)
 
 #4. Добавляем питомца с пустыми значениями "Имя" и "Тип животного"
-def test_add_new_pet_with_invalid_data(name='', animal_type='',
+def test_add_new_pet_with_invalid_data(created_pets, name='', animal_type='',
                                      age='4', pet_photo='images/owl.jpg'):
     """Проверяем что можно добавить питомца без имени и типа животного"""
 
@@ -190,32 +325,27 @@ def test_add_new_pet_with_invalid_data(name='', animal_type='',
 
     # Добавляем питомца
     status, result = pf.add_new_pet(auth_key, name, animal_type, age, pet_photo)
+    # Очистка: добавленный питомец удалится после теста
+    created_pets.append(result['id'])
 
     # Сверяем полученный ответ с ожидаемым результатом
     assert status == 200
     assert result['name'] == name # Добавлен питомец с пустыми значениями "Имя" и "Тип питомца"
 
 #5. Обновляем питомца и вводим спецсимволы в значения "Имя" и "Тип животного"
-def test_update_self_pet_info(name='!@#$%^&', animal_type="@#!$%", age=5):
+def test_update_self_pet_info(my_pet, name='!@#$%^&', animal_type="@#!$%", age=5):
     """Проверяем возможность обновления информации о питомце с использованием спецсимволов"""
 
-    # Получаем ключ auth_key и список своих питомцев
+    # Получаем ключ auth_key и обновляем имя, тип и возраст питомца, созданного для этого теста
     _, auth_key = pf.get_api_key(valid_email, valid_password)
-    _, my_pets = pf.get_list_of_pets(auth_key, "my_pets")
+    status, result = pf.update_pet_info(auth_key, my_pet['id'], name, animal_type, age)
 
-    # Если список не пустой, то пробуем обновить его имя, тип и возраст
-    if len(my_pets['pets']) > 0:
-        status, result = pf.update_pet_info(auth_key, my_pets['pets'][0]['id'], name, animal_type, age)
-
-        # Проверяем что статус ответа = 200 и имя питомца соответствует заданному
-        assert status == 200
-        assert result['name'] == name
-    else:
-        # если список питомцев пустой, то выкидываем исключение с текстом об отсутствии своих питомцев
-        raise Exception("There is no my pets")
+    # Проверяем что статус ответа = 200 и имя питомца соответствует заданному
+    assert status == 200
+    assert result['name'] == name
 
 #6. создаём питомца и в поле "Имя" вводим 260 символов
-def test_add_new_pet_with_big_name_data(name='Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг!Любя, съешь щипцы, — вздохнёт мэр, — кайф', animal_type='тигр',
+def test_add_new_pet_with_big_name_data(created_pets, name='Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг! Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч. Шеф взъярён тчк щипцы с эхом гудбай Жюль. Эй, жлоб! Где туз? Прячь юных съёмщиц в шкаф. Экс-граф? Плюш изъят. Бьём чуждый цен хвощ! Эх, чужак! Общий съём цен шляп (юфть) — вдрызг!Любя, съешь щипцы, — вздохнёт мэр, — кайф', animal_type='тигр',
                                      age='4', pet_photo='images/owl.jpg'):
     """Проверяем что можно добавить питомца с именем в 260 символов"""
 
@@ -227,15 +357,13 @@ def test_add_new_pet_with_big_name_data(name='Любя, съешь щипцы, 
 
     # Добавляем питомца
     status, result = pf.add_new_pet(auth_key, name, animal_type, age, pet_photo)
+    # Очистка: добавленный питомец удалится после теста
+    created_pets.append(result['id'])
 
     # Сверяем полученный ответ с ожидаемым результатом
     assert status == 200
     assert result['name'] == name # Добавлен питомец с именем длиной в 260 символов
 
-# Очистка: удаляем добавленного питомца
-    pet_id = result['id']
-    pf.delete_pet(auth_key, pet_id)
-
 #7-8-9
 import html
 
@@ -281,3 +409,515 @@ def test_get_api_key_missing_parameter():
     assert "This user wasn't found in database" in decoded_result_without_both, "Ожидалось сообщение об ошибке в ответе"
 
 
+class CountingProfile(Profile):
+    """Profile, который считает запросы к своему эндпоинту"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = 0
+
+    def should_fail(self) -> bool:
+        self.requests += 1
+        return super().should_fail()
+
+
+def test_session_reuses_connection_and_retries_idempotent(max_retries=2):
+    """Проверяем, что запросы PetFriends идут через одно keep-alive соединение, GET при ответе 503
+    повторяется max_retries раз, а POST не повторяется"""
+
+    profiles = {'pets': CountingProfile(error_rate=1.0, error_status=503),
+                'create_pet_simple': CountingProfile(error_rate=1.0, error_status=503)}
+    with FakePetFriendsServer(profiles=profiles) as pool_server:
+        accepted = []
+        get_request = pool_server.httpd.get_request
+
+        def counting_get_request():
+            accepted.append(get_request())
+            return accepted[-1]
+
+        pool_server.httpd.get_request = counting_get_request
+        with PetFriends(pool_server.base_url, max_retries=max_retries, backoff_factor=0, key_ttl=0) as pool_pf:
+            for _ in range(5):
+                status, auth_key = pool_pf.get_api_key(valid_email, valid_password)
+                assert status == 200
+            assert len(accepted) == 1
+
+            status, _ = pool_pf.get_list_of_pets(auth_key, "my_pets")
+            assert status == 503
+            assert profiles['pets'].requests == max_retries + 1
+
+            status, _ = pool_pf.add_new_pet_no_photo(auth_key, 'Повтор', 'кот', '1')
+            assert status == 503
+            assert profiles['create_pet_simple'].requests == 1
+
+
+def test_bulk_add_and_delete_pets(count=5):
+    """Проверяем, что пакетные методы add_pets и delete_pets добавляют и удаляют несколько
+    питомцев параллельно и правильно подсчитывают успешные операции"""
+
+    _, auth_key = pf.get_api_key(valid_email, valid_password)
+
+    # Добавляем питомцев пачкой и собираем их id по мере выполнения запросов
+    pets = [{'name': f'{WORKER_TAG}-Пачка{i}', 'animal_type': 'кот', 'age': str(i)} for i in range(count)]
+    added = pf.add_pets(auth_key, pets)
+    pet_ids = [result['id'] for _, status, result in added if status == 200]
+
+    assert added.succeeded == count
+    assert added.failed == 0
+
+    # Очистка: удаляем всех добавленных питомцев одним пакетом
+    deleted = pf.delete_pets(auth_key, pet_ids).wait()
+    assert deleted.succeeded == count
+
+    _, my_pets = pf.get_list_of_pets(auth_key, "my_pets")
+    assert not set(pet_ids) & {pet['id'] for pet in my_pets['pets']}
+
+
+def test_batch_executor_created_once(monkeypatch, threads=8):
+    """Проверяем, что пакетные методы, вызванные одновременно из разных потоков, создают один
+    общий пул потоков, и close() закрывает именно его"""
+
+    created = []
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            # Задержка расширяет окно гонки между проверкой и созданием пула
+            time.sleep(0.01)
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr('api.ThreadPoolExecutor', CountingExecutor)
+    batch_pf = PetFriends(base_url)
+    auth_key = {'key': 'unused'}
+    with ThreadPoolExecutor(max_workers=threads) as callers:
+        list(callers.map(lambda _: batch_pf.delete_pets(auth_key, []).wait(), range(threads)))
+    batch_pf.close()
+
+    assert len(created) == 1
+    assert created[0]._shutdown
+
+
+def test_response_cache_invalidated_by_add_and_delete(name='Кэш', animal_type='кот', age='2'):
+    """Проверяем, что закэшированный список my_pets сбрасывается после добавления и удаления питомца"""
+
+    cached_pf = PetFriends(base_url, response_cache=ResponseCache())
+    _, auth_key = cached_pf.get_api_key(valid_email, valid_password)
+    _, my_pets = cached_pf.get_list_of_pets(auth_key, "my_pets")
+
+    _, result = cached_pf.add_new_pet_no_photo(auth_key, name, animal_type, age)
+    pet_id = result['id']
+    _, my_pets_after_add = cached_pf.get_list_of_pets(auth_key, "my_pets")
+    assert pet_id in [pet['id'] for pet in my_pets_after_add['pets']]
+
+    cached_pf.delete_pet(auth_key, pet_id)
+    _, my_pets_after_delete = cached_pf.get_list_of_pets(auth_key, "my_pets")
+    assert pet_id not in [pet['id'] for pet in my_pets_after_delete['pets']]
+    cached_pf.close()
+
+
+def test_add_pets_with_preloaded_photo(created_pets, pet_photo='images/owl.jpg'):
+    """Проверяем, что одно загруженное в память фото можно отправить несколько раз подряд"""
+
+    pet_photo = os.path.join(os.path.dirname(__file__), pet_photo)
+    _, auth_key = pf.get_api_key(valid_email, valid_password)
+
+    with PetPhoto(pet_photo) as photo:
+        status_first, first = pf.add_new_pet(auth_key, 'Фото1', 'сова', '1', photo)
+        status_second, second = pf.add_new_pet(auth_key, 'Фото2', 'сова', '1', photo)
+    # Очистка: добавленные питомцы удалятся после теста
+    created_pets += [first['id'], second['id']]
+
+    assert status_first == 200 and status_second == 200
+    assert first['pet_photo'] and first['pet_photo'] == second['pet_photo']
+
+
+def test_benchmark_percentile_and_mix():
+    """Проверяем расчёт перцентилей и разбор смеси операций для нагрузочного прогона"""
+
+    latencies = list(range(1, 101))
+    assert percentile(latencies, 50) == 50
+    assert percentile(latencies, 99) == 99
+    assert percentile([], 95) == 0.0
+    assert parse_mix('get_list_of_pets=5,delete_pet') == {'get_list_of_pets': 5.0, 'delete_pet': 1.0}
+
+
+def test_benchmark_excludes_pet_setup_from_latency(setup_latency=0.2):
+    """Проверяем, что создание питомца для update_pet_info и delete_pet не попадает в их задержку:
+    создание питомца на сервере медленное, а сами операции быстрые"""
+
+    profiles = {'create_pet_simple': Profile(latency=setup_latency)}
+    with FakePetFriendsServer(profiles=profiles) as bench_server:
+        with PetFriends(bench_server.base_url, max_retries=0, key_ttl=0) as bench_pf:
+            report = Benchmark(bench_pf, {'update_pet_info': 1, 'delete_pet': 1}, seed=1).run(
+                concurrency=2, requests=10).to_dict()
+
+    for name in ('update_pet_info', 'delete_pet'):
+        assert report['operations'][name]['errors'] == 0
+        assert report['operations'][name]['p99_ms'] < setup_latency * 1000 / 2
+
+
+def test_benchmark_with_models_cleans_up(requests=20):
+    """Проверяем, что с use_models (питомцы - Pet, а не словари) операции с питомцами попадают
+    в отчёт, а все созданные прогоном питомцы удаляются после него"""
+
+    mix = {'update_pet_info': 1, 'delete_pet': 1, 'add_new_pet_no_photo': 1}
+    with FakePetFriendsServer() as bench_server:
+        with PetFriends(bench_server.base_url, max_retries=0, key_ttl=0, use_models=True) as bench_pf:
+            report = Benchmark(bench_pf, mix, seed=1).run(concurrency=2, requests=requests).to_dict()
+            _, auth_key = bench_pf.get_api_key(valid_email, valid_password)
+            _, my_pets = bench_pf.get_list_of_pets(auth_key, "my_pets")
+
+    operations = report['operations']
+    assert set(operations) == set(mix)
+    assert sum(stats['count'] for stats in operations.values()) == requests
+    assert report['total']['errors'] == 0
+    assert not [pet for pet in my_pets if pet.name.startswith('Бенч')]
+
+
+def test_fake_server_error_profile():
+    """Проверяем, что локальный сервер отдаёт заданную в профиле ошибку на выбранном эндпоинте"""
+
+    with FakePetFriendsServer(profiles={'pets': Profile(error_rate=1.0, error_status=503)}) as failing:
+        with PetFriends(failing.base_url, max_retries=0) as failing_pf:
+            status, auth_key = failing_pf.get_api_key(valid_email, valid_password)
+            assert status == 200
+
+            status, _ = failing_pf.get_list_of_pets(auth_key, "my_pets")
+            assert status == 503
+
+
+def test_throttle_opens_circuit_and_slows_down(name='Предохранитель', animal_type='кот', age='1'):
+    """Проверяем, что после ошибок 503 частота запросов к эндпоинту снижается, а после
+    failure_threshold ошибок подряд запросы к нему не отправляются, но методы всё равно
+    возвращают (статус, результат)"""
+
+    throttle = Throttle(limiter={'rate': 50}, breaker={'failure_threshold': 2, 'reset_timeout': 60})
+    profiles = {'create_pet_simple': Profile(error_rate=1.0, error_status=503)}
+    with FakePetFriendsServer(profiles=profiles) as failing:
+        with PetFriends(failing.base_url, max_retries=0, throttle=throttle) as failing_pf:
+            _, auth_key = failing_pf.get_api_key(valid_email, valid_password)
+
+            statuses = [failing_pf.add_new_pet_no_photo(auth_key, name, animal_type, age)[0] for _ in range(3)]
+            assert statuses == [503, 503, None]
+
+            endpoint = 'POST api/create_pet_simple'
+            assert throttle.breakers[endpoint].state == CircuitBreaker.OPEN
+            assert throttle.limiters[endpoint].rate < 50
+            # Остальные эндпоинты работают как обычно
+            status, _ = failing_pf.get_list_of_pets(auth_key, "my_pets")
+            assert status == 200
+
+
+def test_token_bucket_grows_linearly(monkeypatch, rate=10, increase=0.5, seconds=4, responses_per_second=100):
+    """Проверяем, что частота растёт на increase в секунду, сколько бы успешных ответов ни пришло
+    за это время, и не превышает max_rate"""
+
+    clock = [1000.0]
+    # Часы подменяются только для модуля throttle
+    monkeypatch.setattr('throttle.time', types.SimpleNamespace(monotonic=lambda: clock[0], sleep=time.sleep))
+    bucket = TokenBucket(rate=rate, increase=increase)
+    for _ in range(seconds * responses_per_second):
+        clock[0] += 1 / responses_per_second
+        bucket.on_success()
+    assert bucket.rate == pytest.approx(rate + increase * seconds)
+
+    # После долгой паузы частота растёт не больше, чем за секунду, и упирается в max_rate
+    clock[0] += 3600
+    bucket.on_success()
+    assert bucket.rate == pytest.approx(rate + increase * (seconds + 1))
+    for _ in range(100):
+        clock[0] += 1
+        bucket.on_success()
+    assert bucket.rate == bucket.max_rate == rate * 2
+
+
+def test_metrics_hooks_record_timings():
+    """Проверяем, что хуки метрик получают замер каждого запроса с временем и размерами"""
+
+    timings = []
+    histogram = LatencyHistogram()
+    with PetFriends(base_url, metrics_hooks=[timings.append, histogram]) as measured_pf:
+        _, auth_key = measured_pf.get_api_key(valid_email, valid_password)
+        measured_pf.get_list_of_pets(auth_key, "my_pets")
+
+    endpoints = [timing.endpoint for timing in timings]
+    assert endpoints == ['GET api/key', 'GET api/pets']
+    assert all(timing.status == 200 and timing.total > 0 and timing.response_bytes > 0 for timing in timings)
+    assert 'petfriends_requests_total{endpoint="GET api/pets",status="200"} 1' in histogram.to_prometheus()
+
+
+def test_metrics_hooks_try_every_resolved_address(monkeypatch, host='petfriends.test'):
+    """Проверяем, что с хуками метрик клиент, как и urllib3, пробует все адреса из DNS: первый
+    адрес недоступен (на 127.0.0.2 никто не слушает), запрос уходит на второй"""
+
+    getaddrinfo = socket.getaddrinfo
+
+    def resolve(name, *args, **kwargs):
+        if name != host:
+            return getaddrinfo(name, *args, **kwargs)
+        return getaddrinfo('127.0.0.2', *args, **kwargs) + getaddrinfo('127.0.0.1', *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', resolve)
+    timings = []
+    with FakePetFriendsServer() as key_server:
+        port = key_server.httpd.server_address[1]
+        with PetFriends(f"http://{host}:{port}/", metrics_hooks=[timings.append]) as measured_pf:
+            status, result = measured_pf.get_api_key(valid_email, valid_password)
+
+    assert status == 200 and 'key' in result
+    assert timings[0].status == 200 and timings[0].dns > 0 and timings[0].connect > 0
+
+
+def test_use_models_returns_pet_objects(created_pets, name='Модель', animal_type='кот', age='3'):
+    """Проверяем, что с use_models методы возвращают Pet и PetList, а поля доступны
+    и как атрибуты, и по ключу, как в словаре"""
+
+    with PetFriends(base_url, use_models=True) as model_pf:
+        _, auth_key = model_pf.get_api_key(valid_email, valid_password)
+        status, pet = model_pf.add_new_pet_no_photo(auth_key, name, animal_type, age)
+        created_pets.append(pet.id)
+
+        assert status == 200
+        assert isinstance(pet, Pet)
+        assert pet.name == pet['name'] == name
+
+        _, my_pets = model_pf.get_list_of_pets(auth_key, "my_pets")
+        assert isinstance(my_pets, PetList)
+        assert pet.id in my_pets.ids()
+        # Pet создаётся при первом обращении и дальше возвращается тот же
+        assert isinstance(my_pets[0], Pet) and my_pets[0] is my_pets[0]
+        assert my_pets.compact().to_dict() == PetList.from_dicts(my_pets.to_dict()['pets']).to_dict()
+        assert pet in list(my_pets)
+
+
+def test_pet_index_follows_changes(auth_key, created_pets, name='Индекс', animal_type='ёж', age='41'):
+    """Проверяем, что index_pets строит индекс по моим питомцам, а добавление, изменение
+    и удаление питомца сразу отражаются в нём без повторного запроса списка"""
+
+    index = pf.index_pets(auth_key)
+    assert isinstance(index, PetIndex)
+
+    _, pet = pf.add_new_pet_no_photo(auth_key, name, animal_type, age)
+    created_pets.append(pet['id'])
+    assert pet['id'] in index
+    assert [p['id'] for p in index.by_name(name)] == [pet['id']]
+    assert pet['id'] in [p['id'] for p in index.by_animal_type(animal_type)]
+
+    pf.update_pet_info(auth_key, pet['id'], name, animal_type, 42)
+    assert pet['id'] in [p['id'] for p in index.by_age(42, 42)]
+    assert pet['id'] not in [p['id'] for p in index.by_age(max_age=41.5)]
+
+    pf.delete_pet(auth_key, pet['id'])
+    assert pet['id'] not in index
+    assert index.by_name(name) == []
+
+
+def test_pet_index_follows_refreshed_key(name='Индекс', animal_type='ёж', age='5'):
+    """Проверяем, что индекс продолжает получать изменения после того, как сервер забыл ключ
+    и PetFriends перелогинился (ключ в словаре auth_key обновился на месте)"""
+
+    with FakePetFriendsServer() as key_server, PetFriends(key_server.base_url) as expiring_pf:
+        _, auth_key = expiring_pf.get_api_key(valid_email, valid_password)
+        index = expiring_pf.index_pets(auth_key)
+        old_key = auth_key['key']
+
+        key_server.store.keys.clear()
+        status, pet = expiring_pf.add_new_pet_no_photo(auth_key, name, animal_type, age)
+
+        assert status == 200 and auth_key['key'] != old_key
+        assert pet['id'] in index
+        expiring_pf.delete_pet(auth_key, pet['id'])
+        assert pet['id'] not in index
+
+
+def test_pet_index_survives_bulk_delete(auth_key, created_pets, count=100):
+    """Проверяем, что индекс остаётся целым, когда delete_pets удаляет питомцев из нескольких
+    потоков одновременно"""
+
+    pets = [{'name': f"{WORKER_TAG}-индекс{i}", 'animal_type': 'кот', 'age': str(i % 7)} for i in range(count)]
+    pet_ids = [result['id'] for _, status, result in pf.add_pets(auth_key, pets) if status == 200]
+    created_pets += pet_ids
+    index = pf.index_pets(auth_key)
+    assert all(pet_id in index for pet_id in pet_ids)
+
+    batch = pf.delete_pets(auth_key, pet_ids).wait()
+
+    assert (batch.succeeded, batch.failed) == (count, 0)
+    assert not any(pet_id in index for pet_id in pet_ids)
+    assert sorted(pet['id'] for pet in index.by_age()) == sorted(pet['id'] for pet in index
+                                                                 if pet['age'].isdigit())
+
+
+def test_pet_index_concurrent_remove(count=4000, threads=8):
+    """Проверяем, что одновременные remove из нескольких потоков не ломают индекс возрастов.
+    Интервал переключения потоков уменьшен, чтобы гонка проявлялась на каждом запуске"""
+
+    index = PetIndex({'id': str(i), 'name': 'n', 'animal_type': 't', 'age': str(i % 15)} for i in range(count))
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(index.remove, [str(i) for i in range(count)]))
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert len(index) == 0
+    assert index.by_age() == [] and index.by_name('n') == []
+
+
+def test_workflow_runs_chains_for_many_pets(auth_key, body_matching_pf, pet_photo='images/owl.jpg', count=4):
+    """Проверяем, что цепочка добавление -> фото -> изменение -> удаление выполняется для
+    нескольких питомцев, id питомца передаётся между шагами, а время каждого шага замерено"""
+
+    with PetPhoto(os.path.join(os.path.dirname(__file__), pet_photo)) as photo:
+        workflow = (Workflow()
+                    .then('add_new_pet_no_photo')
+                    .then('post_new_photo_of_pet', pet_photo=photo)
+                    .then('update_pet_info', age=lambda pet: int(pet['age']) + 1)
+                    .then('delete_pet', always=True))
+        pets = [{'name': f"{WORKER_TAG}-цепочка{i}", 'animal_type': 'кот', 'age': str(i)} for i in range(count)]
+        batch = body_matching_pf.run_workflow(auth_key, workflow, pets)
+        chains = [chain for _, _, chain in batch]
+
+    assert batch.succeeded == count
+    for chain in chains:
+        assert [step.method for step in chain.steps] == [
+            'add_new_pet_no_photo', 'post_new_photo_of_pet', 'update_pet_info', 'delete_pet']
+        assert chain.steps[2].result['id'] == chain.pet_id
+        assert chain.steps[2].result['age'] == str(int(chain.item['age']) + 1)
+        assert chain.elapsed >= sum(step.elapsed for step in chain.steps) > 0
+
+    my_pet_ids = [pet['id'] for pet in body_matching_pf.iter_pets(auth_key, "my_pets")]
+    assert not any(chain.pet_id in my_pet_ids for chain in chains)
+
+
+def test_cassette_replays_without_network(tmp_path, name='Кассета', animal_type='кот', age='2'):
+    """Проверяем, что записанные в кассету запросы воспроизводятся без сервера (адрес, на котором
+    никто не слушает), в том числе после удаления индекса, а незаписанный запрос не проходит"""
+
+    path = str(tmp_path / 'petfriends.cassette')
+    with FakePetFriendsServer() as recorded, Cassette(path, 'record') as cassette:
+        with PetFriends(recorded.base_url, cassette=cassette) as recording_pf:
+            _, auth_key = recording_pf.get_api_key(valid_email, valid_password)
+            expected = [recording_pf.add_new_pet_no_photo(auth_key, name, animal_type, age),
+                        recording_pf.get_list_of_pets(auth_key, "my_pets")]
+    os.remove(path + '.idx')
+
+    with Cassette(path, 'replay') as cassette:
+        with PetFriends('http://127.0.0.1:9/', max_retries=0, cassette=cassette) as replay_pf:
+            _, auth_key = replay_pf.get_api_key(valid_email, valid_password)
+            assert [replay_pf.add_new_pet_no_photo(auth_key, name, animal_type, age),
+                    replay_pf.get_list_of_pets(auth_key, "my_pets")] == expected
+            assert len(cassette) == 3
+
+            with pytest.raises(CassetteMiss):
+                replay_pf.delete_pet(auth_key, expected[0][1]['id'])
+
+
+def test_cassette_hides_secrets_and_keeps_streaming(tmp_path, chunk_size=64):
+    """Проверяем, что в кассету не попадают email, пароль и auth_key из заголовков запроса,
+    а досрочно прерванный iter_pets не скачивает ответ целиком ради записи: записывается
+    прочитанная часть, и при воспроизведении iter_pets отдаёт тех же питомцев"""
+
+    path = str(tmp_path / 'petfriends.cassette')
+    with FakePetFriendsServer() as recorded, Cassette(path, 'record') as cassette:
+        with PetFriends(recorded.base_url, cassette=cassette) as recording_pf:
+            _, auth_key = recording_pf.get_api_key(valid_email, valid_password)
+            first_pet = next(recording_pf.iter_pets(auth_key, "", chunk_size=chunk_size))
+            status, all_pets = recording_pf.get_list_of_pets(auth_key, "")
+
+        headers = [cassette._read_header(offset) for offsets in cassette._load_index().values()
+                   for offset in offsets]
+    streamed, listed = [header for header in headers if header['key'].startswith('GET api/pets')]
+    assert streamed['length'] < listed['length']
+    for header in headers:
+        values = set(header['request_headers'].values())
+        assert not values & {valid_email, valid_password, auth_key['key']}
+
+    with Cassette(path, 'replay') as cassette:
+        with PetFriends('http://127.0.0.1:9/', max_retries=0, cassette=cassette) as replay_pf:
+            _, auth_key = replay_pf.get_api_key(valid_email, valid_password)
+            assert next(replay_pf.iter_pets(auth_key, "", chunk_size=chunk_size)) == first_pet
+            assert replay_pf.get_list_of_pets(auth_key, "") == (status, all_pets)
+
+
+def test_photo_preprocessor_downsizes_and_caches(created_pets, max_side=64):
+    """Проверяем, что большое фото перед загрузкой уменьшается до max_side по большей стороне,
+    а повторная загрузка того же фото берёт готовые байты из кэша"""
+
+    Image = pytest.importorskip('PIL.Image')
+    source = io.BytesIO()
+    Image.effect_noise((640, 480), 64).convert('RGB').save(source, 'PNG')
+
+    with PhotoPreprocessor(max_side=max_side, max_workers=1) as preprocessor:
+        with PetFriends(base_url, photo_preprocessor=preprocessor) as photo_pf:
+            _, auth_key = photo_pf.get_api_key(valid_email, valid_password)
+            results = [photo_pf.add_new_pet(auth_key, f"{WORKER_TAG}-фото", 'кот', '1', source.getvalue())
+                       for _ in range(2)]
+        created_pets += [result['id'] for _, result in results]
+
+        assert [status for status, _ in results] == [200, 200]
+        assert (preprocessor.misses, preprocessor.hits) == (1, 1)
+
+    photo = base64.b64decode(results[0][1]['pet_photo'].partition('base64,')[2])
+    assert len(photo) < len(source.getvalue())
+    with Image.open(io.BytesIO(photo)) as uploaded:
+        assert uploaded.format == 'JPEG' and max(uploaded.size) == max_side
+
+
+def test_import_api_is_fast():
+    """Проверяем, что import api не загружает requests, requests_toolbelt, urllib3, Pillow и orjson
+    и поэтому занимает меньше времени, чем импорт одного requests"""
+
+    api_import = import_time('api', repeat=3)
+    assert not {'requests', 'requests_toolbelt', 'urllib3', 'PIL', 'orjson'} & set(api_import['modules'])
+    assert api_import['seconds'] < import_time('requests', repeat=3)['seconds']
+
+
+def test_async_client_runs_all_methods(pet_photo='images/owl.jpg', concurrency=3, latency=0.1, count=12):
+    """Проверяем все семь корутин AsyncPetFriends на локальном сервере, ответ (статус, текст)
+    при ошибке сервера и то, что gather не выполняет больше concurrency запросов одновременно"""
+
+    pytest.importorskip('aiohttp')
+    from async_api import AsyncPetFriends
+
+    pet_photo = os.path.join(os.path.dirname(__file__), pet_photo)
+    profiles = {'pets': Profile(latency=latency), 'set_photo': Profile(error_rate=1.0, error_status=500)}
+
+    async def scenario(base_url: str) -> dict:
+        async with AsyncPetFriends(base_url, concurrency=concurrency) as apf:
+            results = {'get_api_key': await apf.get_api_key(valid_email, valid_password)}
+            auth_key = results['get_api_key'][1]
+            results['add_new_pet'] = await apf.add_new_pet(auth_key, 'Асинх', 'кот', '1', pet_photo)
+            results['add_new_pet_no_photo'] = await apf.add_new_pet_no_photo(auth_key, 'Асинх', 'кот', '2')
+            pet_id = results['add_new_pet_no_photo'][1]['id']
+            results['post_new_photo_of_pet'] = await apf.post_new_photo_of_pet(auth_key, pet_id, pet_photo)
+            results['update_pet_info'] = await apf.update_pet_info(auth_key, pet_id, 'Асинх2', 'кот', 3)
+            results['delete_pet'] = await apf.delete_pet(auth_key, pet_id)
+
+            start = time.perf_counter()
+            lists = await asyncio.gather(*(apf.get_list_of_pets(auth_key, "my_pets") for _ in range(count)))
+            results['gather_elapsed'] = time.perf_counter() - start
+            results['get_list_of_pets'] = lists[0]
+            results['gather_statuses'] = {status for status, _ in lists}
+            return results
+
+    with FakePetFriendsServer(profiles=profiles) as async_server:
+        results = asyncio.run(scenario(async_server.base_url))
+        # Синхронный клиент для сравнения ответа на ошибку сервера
+        with PetFriends(async_server.base_url, max_retries=0) as sync_pf:
+            _, auth_key = sync_pf.get_api_key(valid_email, valid_password)
+            _, pet = sync_pf.add_new_pet_no_photo(auth_key, 'Синх', 'кот', '1')
+            sync_error = sync_pf.post_new_photo_of_pet(auth_key, pet['id'], pet_photo)
+
+    for name in ('get_api_key', 'add_new_pet', 'add_new_pet_no_photo', 'update_pet_info', 'delete_pet'):
+        assert results[name][0] == 200, name
+    assert results['update_pet_info'][1]['name'] == 'Асинх2'
+    # Как и синхронный клиент, при ответе 4xx/5xx возвращается текст ответа сервера
+    assert results['post_new_photo_of_pet'] == sync_error == (500, 'Internal Server Error')
+
+    assert results['gather_statuses'] == {200}
+    assert results['add_new_pet'][1]['id'] in [pet['id'] for pet in results['get_list_of_pets'][1]['pets']]
+    # count запросов по concurrency штук занимают не меньше count / concurrency задержек сервера
+    assert results['gather_elapsed'] >= count / concurrency * latency * 0.9
+    assert results['gather_elapsed'] < count * latency
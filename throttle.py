@@ -0,0 +1,194 @@
+"""Ограничение частоты запросов и предохранитель для общего сервера Pet Friends.
+
+TokenBucket выдаёт запросы с заданной частотой и подстраивает её по схеме AIMD: пока ответы
+успешные, частота растёт на постоянную величину в секунду, после ответа 429 или 5xx уменьшается
+в несколько раз.
+CircuitBreaker после серии ошибок подряд на время перестаёт пускать запросы к эндпоинту, чтобы
+не нагружать сервер, которому и так плохо. Throttle хранит их по эндпоинтам, PetFriends(throttle=...)
+проверяет его перед каждым запросом и сообщает ему результат"""
+import threading
+import time
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+
+class CircuitOpenError(RequestsConnectionError):
+    """Запрос не отправлен: предохранитель эндпоинта разомкнут. Наследуется от ConnectionError
+    из requests, поэтому обрабатывается там же, где и недоступность сервера"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Предохранитель {endpoint} разомкнут, повторите через {retry_in:.1f} с")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    """Token bucket с подстройкой частоты (AIMD).
+
+    rate - начальная частота, запросов в секунду; burst - сколько запросов можно отправить
+    подряд без ожидания (по умолчанию равно rate); min_rate, max_rate - пределы частоты
+    (по умолчанию max_rate - удвоенная начальная частота);
+    increase - на сколько запросов в секунду частота растёт за каждую секунду успешных ответов
+    (рост не зависит от количества ответов, иначе частота росла бы экспоненциально);
+    decrease - во сколько раз частота падает после 429 или 5xx; cooldown - частота уменьшается
+    не чаще раза в cooldown секунд, чтобы пачка ошибок от уже отправленных запросов не обрушила её"""
+
+    def __init__(self, rate: float = 10, burst: float = None, min_rate: float = 0.5, max_rate: float = None,
+                 increase: float = 0.5, decrease: float = 0.5, cooldown: float = 1.0):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate * 2
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._decreased = float('-inf')
+        self._increased = self._updated
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self._tokens + (now - self._updated) * self.rate, self.burst)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Ждёт своей очереди на запрос и возвращает время ожидания в секундах. Токен резервируется
+        сразу, поэтому потоки ждут без блокировки и выходят в том порядке, в котором пришли"""
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def on_success(self):
+        """Успешный ответ: частота растёт на increase за каждую секунду с прошлого роста. После
+        паузы в запросах учитывается не больше секунды, чтобы частота не подскочила разом"""
+
+        with self._lock:
+            now = time.monotonic()
+            elapsed = min(now - self._increased, 1.0)
+            self.rate = min(self.rate + self.increase * elapsed, self.max_rate)
+            self._increased = now
+
+    def on_throttle(self, retry_after: float = None):
+        """Сервер не справляется (429 или 5xx): снижаем частоту, а если он прислал Retry-After,
+        ещё и откладываем следующие запросы на это время"""
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now - self._decreased >= self.cooldown:
+                self.rate = max(self.rate * self.decrease, self.min_rate)
+                self._decreased = self._increased = now
+            if retry_after:
+                self._tokens = min(self._tokens, 0.0) - retry_after * self.rate
+
+
+class CircuitBreaker:
+    """Предохранитель: после failure_threshold ошибок подряд размыкается и reset_timeout секунд
+    отклоняет запросы, затем пропускает один пробный запрос. Успешный пробный запрос замыкает
+    предохранитель, ошибка снова размыкает его"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        """Через сколько секунд предохранитель пропустит пробный запрос (0 - пропускает сейчас)"""
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            return max(self._opened + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened = time.monotonic()
+            self._probing = False
+
+
+class Throttle:
+    """TokenBucket и CircuitBreaker для каждого эндпоинта (названия как в metrics.endpoint_of,
+    например 'POST api/create_pet_simple' или 'PUT api/pets/{id}'), создаются при первом запросе.
+
+    limiter - параметры TokenBucket для всех эндпоинтов (None - частота не ограничивается);
+    breaker - параметры CircuitBreaker (None - без предохранителя);
+    endpoints - словарь 'эндпоинт': {'limiter': {...}, 'breaker': {...}} с параметрами, которые
+    заменяют общие для этого эндпоинта; значение None отключает ограничитель или предохранитель"""
+
+    def __init__(self, limiter: dict = None, breaker: dict = None, endpoints: dict = None):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.endpoints = dict(endpoints or {})
+        self.limiters = {}
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, endpoint: str) -> tuple:
+        with self._lock:
+            if endpoint not in self.limiters:
+                options = self.endpoints.get(endpoint, {})
+                limiter = options.get('limiter', self.limiter)
+                breaker = options.get('breaker', self.breaker)
+                self.limiters[endpoint] = TokenBucket(**limiter) if limiter is not None else None
+                self.breakers[endpoint] = CircuitBreaker(**breaker) if breaker is not None else None
+            return self.limiters[endpoint], self.breakers[endpoint]
+
+    def before(self, endpoint: str):
+        """Вызывается перед запросом: ждёт токен или бросает CircuitOpenError"""
+
+        limiter, breaker = self._get(endpoint)
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(endpoint, breaker.retry_in())
+        if limiter is not None:
+            limiter.acquire()
+
+    def after(self, endpoint: str, status: int = None, retry_after: float = None):
+        """Вызывается после запроса со статусом ответа (None - ответ не получен)"""
+
+        limiter, breaker = self._get(endpoint)
+        failed = status is None or status == 429 or status >= 500
+        if limiter is not None:
+            if failed:
+                limiter.on_throttle(retry_after)
+            else:
+                limiter.on_success()
+        if breaker is not None:
+            if failed:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
@@ -0,0 +1,116 @@
+"""Цепочки зависимых запросов, например: добавить питомца -> загрузить фото -> изменить данные ->
+удалить. Цепочка описывается один раз и выполняется для многих питомцев одновременно через
+PetFriends.run_workflow: шаги одной цепочки идут по порядку, а цепочки разных питомцев
+перекрываются в пуле потоков PetFriends.
+
+Пример:
+    workflow = (Workflow()
+                .then('add_new_pet_no_photo')
+                .then('post_new_photo_of_pet', pet_photo=photo)
+                .then('update_pet_info', age=lambda pet: int(pet['age']) + 1)
+                .then('delete_pet', always=True))
+    for pet, status, chain in pf.run_workflow(auth_key, workflow, pets):
+        print(chain.elapsed, [(step.method, step.status, step.elapsed) for step in chain.steps])
+"""
+import inspect
+import time
+
+
+class Step:
+    """Шаг цепочки: имя метода PetFriends и его аргументы. Аргументы, которых нет в kwargs,
+    берутся из словаря питомца, переданного в run_workflow, а pet_id - из результата предыдущего
+    шага. Если значение аргумента - функция, она вызывается от словаря питомца.
+    always=True - шаг выполняется, даже если один из предыдущих шагов завершился ошибкой"""
+
+    def __init__(self, method: str, always: bool = False, **kwargs):
+        self.method = method
+        self.always = always
+        self.kwargs = kwargs
+
+    def arguments(self, func, item: dict, pet_id: str) -> dict:
+        """Аргументы для вызова метода func (auth_key передаётся отдельно)"""
+
+        values = {}
+        for name in list(inspect.signature(func).parameters)[1:]:
+            if name in self.kwargs:
+                value = self.kwargs[name]
+                values[name] = value(item) if callable(value) else value
+            elif name == 'pet_id' and pet_id is not None:
+                values[name] = pet_id
+            elif name in item:
+                values[name] = item[name]
+        return values
+
+
+class StepResult:
+    """Статус, результат и время выполнения одного шага в секундах"""
+
+    __slots__ = ('method', 'status', 'result', 'elapsed')
+
+    def __init__(self, method: str, status: int, result, elapsed: float):
+        self.method = method
+        self.status = status
+        self.result = result
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f"StepResult({self.method!r}, status={self.status!r}, elapsed={self.elapsed:.4f})"
+
+
+class ChainResult:
+    """Итог цепочки для одного питомца: выполненные шаги, id питомца и общее время в секундах"""
+
+    def __init__(self, item: dict):
+        self.item = item
+        self.pet_id = item.get('id')
+        self.steps = []
+        self.elapsed = 0.0
+
+    @property
+    def status(self) -> int:
+        """Статус первого неуспешного шага или 200, если все шаги выполнены успешно"""
+
+        for step in self.steps:
+            if step.status != 200:
+                return step.status
+        return 200
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+
+class Workflow:
+    """Описание цепочки шагов. Шаги добавляются методом then, который возвращает сам Workflow"""
+
+    def __init__(self, steps: list = None):
+        self.steps = list(steps or [])
+
+    def then(self, method: str, always: bool = False, **kwargs) -> 'Workflow':
+        self.steps.append(Step(method, always, **kwargs))
+        return self
+
+    def run_chain(self, pf, auth_key: dict, item: dict) -> tuple:
+        """Выполняет шаги для одного питомца и возвращает (статус, ChainResult). После первой
+        ошибки выполняются только шаги с always=True"""
+
+        chain = ChainResult(item)
+        failed = False
+        start = time.perf_counter()
+        for step in self.steps:
+            if failed and not step.always:
+                continue
+            func = getattr(pf, step.method)
+            step_start = time.perf_counter()
+            try:
+                status, result = func(auth_key, **step.arguments(func, item, chain.pet_id))
+            except Exception as e:
+                status, result = None, str(e)
+            chain.steps.append(StepResult(step.method, status, result, time.perf_counter() - step_start))
+
+            if status != 200:
+                failed = True
+            elif hasattr(result, 'get') and result.get('id') is not None:
+                chain.pet_id = result['id']
+        chain.elapsed = time.perf_counter() - start
+        return chain.status, chain